@@ -0,0 +1,149 @@
+"""asyncio interface to the spotify api for tools that fan out many requests
+"""
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from client import SpotifyClient, catalog_id
+
+
+class AsyncSpotifyClient():
+
+    def __init__(self, client=None, secret=None, csrf=None, redirect=None, scope=None,
+                 concurrency=10, transport=None):
+        """ Asyncio counterpart of SpotifyClient exposing the same api methods
+            as coroutines, so independent requests can run in parallel:
+
+                async with AsyncSpotifyClient(client=app, secret=key) as api:
+                    track, playback = await api.gather(
+                        api.get_current_track(), api.get_playback_status())
+
+            Requests are sent by a SpotifyClient through a keep-alive
+            ConnectionPool shared by every coroutine. At most `concurrency`
+            requests are in flight at once; further calls wait their turn.
+
+            Cancelling a coroutine that is waiting for a slot removes it from
+            the queue. A request that has already been sent completes in its
+            worker thread, but its result is discarded.
+
+            ARGUMENTS:
+                client, secret, csrf, redirect, scope: see SpotifyClient
+
+                concurrency     int: maximum number of simultaneous requests,
+                                     also used as the api host pool size.
+
+                transport ConnectionPool: optional pool shared with other
+                                     clients, see SpotifyClient.
+        """
+        self.sync = SpotifyClient(
+            client=client, secret=secret, csrf=csrf, redirect=redirect, scope=scope,
+            transport=transport, pool_sizes={'api.spotify.com': concurrency})
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._slots = None
+        self._refreshing = None
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(concurrency={self.concurrency})>"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def authorized(self):
+        return self.sync.authorized
+
+    @authorized.setter
+    def authorized(self, header):
+        self.sync.authorized = header
+
+    @property
+    def refresh(self):
+        return self.sync.refresh
+
+    @refresh.setter
+    def refresh(self, token):
+        self.sync.refresh = token
+
+    async def close(self):
+        """wait for running requests, then release threads and connections"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self.executor.shutdown, wait=True))
+        self.sync.close()
+
+    async def run(self, method, *args, **kwargs):
+        """run a blocking SpotifyClient method once a request slot is free"""
+        if self._slots is None:
+            # created lazily so the semaphore binds to the running loop
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            call = partial(getattr(self.sync, method), *args, **kwargs)
+            return await loop.run_in_executor(self.executor, call)
+
+    async def gather(self, *coroutines):
+        """run coroutines concurrently and return their results in order.
+
+           Unlike asyncio.gather, if any request raises, the remaining ones
+           are cancelled before the exception propagates.
+        """
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        try:
+            return await asyncio.gather(*tasks)
+
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def refresh_access_token(self):
+        """refresh the access token once, however many coroutines ask for it"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self.run('refresh_access_token'))
+        return await asyncio.shield(self._refreshing)
+
+    async def get_current_track(self):
+        """see SpotifyClient.get_current_track"""
+        return await self.run('get_current_track')
+
+    async def get_playback_status(self):
+        """see SpotifyClient.get_playback_status"""
+        return await self.run('get_playback_status')
+
+    async def get_playlists(self):
+        """see SpotifyClient.get_playlists"""
+        return await self.run('get_playlists')
+
+    async def get_playlist(self, playlist_id):
+        """see SpotifyClient.get_playlist"""
+        return await self.run('get_playlist', playlist_id)
+
+    async def add_track(self, playlist_id, uri):
+        """see SpotifyClient.add_track"""
+        return await self.run('add_track', playlist_id, uri)
+
+    async def delete_track(self, playlist_id, uri):
+        """see SpotifyClient.delete_track"""
+        return await self.run('delete_track', playlist_id, uri)
+
+    async def get_tracks(self, ids):
+        """see SpotifyClient.get_tracks"""
+        return await self.run('get_tracks', ids)
+
+    async def get_track(self, id):
+        """a single track. Lookups made by every coroutine within the batch
+           window are sent together, without holding a thread each."""
+        return await self.load('tracks', id)
+
+    async def get_album(self, id):
+        return await self.load('albums', id)
+
+    async def get_artist(self, id):
+        return await self.load('artists', id)
+
+    async def load(self, kind, id):
+        return await asyncio.wrap_future(self.sync.loaders[kind].load(catalog_id(id)))
@@ -0,0 +1,110 @@
+"""compare recursive fetch() with compile_path() and fetch_many().
+
+Payloads are shaped like real api responses: a player state and playlist
+track pages where every track carries its album, artists, images and the
+list of available markets, which is where most of the bulk is.
+
+USAGE (from the src directory):
+    python -m benchmarks.fetch
+    python -m benchmarks.fetch --tracks 100 --repeat 200
+"""
+import sys
+import time
+import argparse
+from utilities import fetch, fetch_many, compile_path
+
+MARKETS = ['AD', 'AE', 'AR', 'AT', 'AU', 'BE', 'BG', 'BO', 'BR', 'CA', 'CH', 'CL', 'CO',
+           'CR', 'CY', 'CZ', 'DE', 'DK', 'DO', 'EC', 'EE', 'ES', 'FI', 'FR', 'GB', 'GR',
+           'GT', 'HK', 'HN', 'HU', 'ID', 'IE', 'IL', 'IN', 'IS', 'IT', 'JP', 'LI', 'LT',
+           'LU', 'LV', 'MA', 'MC', 'MT', 'MX', 'MY', 'NI', 'NL', 'NO', 'NZ', 'PA', 'PE',
+           'PH', 'PL', 'PT', 'PY', 'RO', 'SE', 'SG', 'SK', 'SV', 'TH', 'TN', 'TR', 'TW',
+           'US', 'UY', 'VN', 'ZA'] * 2
+
+
+def artist(number):
+    return {
+        'external_urls': {'spotify': f'https://open.spotify.com/artist/{number:022d}'},
+        'href': f'https://api.spotify.com/v1/artists/{number:022d}',
+        'id': f'{number:022d}', 'name': f'Artist {number}', 'type': 'artist',
+        'uri': f'spotify:artist:{number:022d}'}
+
+
+def track(number):
+    """a full track object as found in playlist and player responses"""
+    return {
+        'album': {
+            'album_type': 'album', 'artists': [artist(number % 97)],
+            'available_markets': list(MARKETS),
+            'external_urls': {'spotify': f'https://open.spotify.com/album/{number:022d}'},
+            'href': f'https://api.spotify.com/v1/albums/{number:022d}',
+            'id': f'{number:022d}',
+            'images': [{'height': size, 'width': size, 'url': f'https://i.scdn.co/image/{number}-{size}'}
+                       for size in (640, 300, 64)],
+            'name': f'Album {number}', 'release_date': '2019-05-17', 'total_tracks': 12,
+            'type': 'album', 'uri': f'spotify:album:{number:022d}'},
+        'artists': [artist(number % 97), artist(number % 89 + 100)],
+        'available_markets': list(MARKETS),
+        'disc_number': 1, 'duration_ms': 180000 + number, 'explicit': False,
+        'external_ids': {'isrc': f'USRC1{number:07d}'},
+        'external_urls': {'spotify': f'https://open.spotify.com/track/{number:022d}'},
+        'href': f'https://api.spotify.com/v1/tracks/{number:022d}',
+        'id': f'{number:022d}', 'is_local': False, 'name': f'Track {number}',
+        'popularity': 50, 'preview_url': None, 'track_number': number % 12 + 1,
+        'type': 'track', 'uri': f'spotify:track:{number:022d}'}
+
+
+def playlist_page(count):
+    return {
+        'href': 'https://api.spotify.com/v1/playlists/x/tracks?offset=0&limit=100',
+        'items': [{'added_at': '2020-01-01T00:00:00Z', 'added_by': {'id': 'user'},
+                   'is_local': False, 'track': track(number)} for number in range(count)],
+        'limit': 100, 'next': None, 'offset': 0, 'previous': None, 'total': count}
+
+
+def playback():
+    return {
+        'device': {'id': 'abc', 'is_active': True, 'name': 'Laptop', 'type': 'Computer',
+                   'volume_percent': 80},
+        'shuffle_state': False, 'repeat_state': 'off', 'timestamp': 1602784523000,
+        'context': {'type': 'playlist', 'uri': 'spotify:playlist:x'},
+        'progress_ms': 43000, 'item': track(7), 'currently_playing_type': 'track',
+        'is_playing': True}
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    page, state = playlist_page(args.tracks), playback()
+    duration, progress = compile_path('item.duration_ms'), compile_path('progress_ms')
+    names = [compile_path(path) for path in ('item.artists.0.name', 'item.album.name', 'item.name')]
+    uris = compile_path('items.*.track.uri')
+
+    cases = {
+        'track duration: fetch x2': lambda: (next(fetch(state, 'duration_ms')),
+                                             next(fetch(state, 'progress_ms'))),
+        'track duration: compile_path': lambda: (duration(state), progress(state)),
+        'status names: fetch + dedupe': lambda: list({name: 0 for name in fetch(state, 'name')}),
+        'status names: compile_path': lambda: [name(state) for name in names],
+        'playlist uris: fetch': lambda: [uri for uri in fetch(page, 'uri') if 'track' in uri],
+        'uris + names: fetch x2': lambda: (list(fetch(page, 'uri')), list(fetch(page, 'name'))),
+        'uris + names: fetch_many': lambda: fetch_many(page, ['uri', 'name']),
+        'playlist uris: compile_path': lambda: uris(page),
+    }
+
+    sys.stdout.write(f"{args.tracks} track playlist page, {args.repeat} repeats\n\n")
+    for name, case in cases.items():
+        sys.stdout.write("%-35s %12.1f us\n" % (name, timed(case, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
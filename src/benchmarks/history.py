@@ -0,0 +1,81 @@
+"""compare listening history queries: json lines vs the binary History log.
+
+USAGE (from the src directory):
+    python -m benchmarks.history
+    python -m benchmarks.history --plays 2000000 --tracks 20000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from collections import Counter
+from history import History, RECORD
+from benchmarks.membership import fake_uris
+
+
+def json_top(filename, since, limit=10):
+    """top tracks from one json object per play"""
+    counts = Counter()
+    with open(filename, 'r') as plays:
+        for line in plays:
+            play = json.loads(line)
+            if play['started'] >= since and play['played_ms'] >= 30000:
+                counts[play['uri']] += 1
+    return counts.most_common(limit)
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--plays', type=int, default=1000000)
+    parser.add_argument('--tracks', type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    uris = fake_uris(args.tracks)
+    artists = fake_uris(args.tracks // 10, seed=1)
+    start = 1500000000
+    plays = [(start + number * 200, rng.randrange(args.tracks), rng.randrange(240000))
+             for number in range(args.plays)]
+    middle = plays[len(plays) // 2][0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text = os.path.join(tmp, 'plays.json')
+        with open(text, 'w') as file:
+            for started, track, played in plays:
+                file.write(json.dumps({'started': started, 'uri': uris[track], 'name': 'track',
+                                       'duration_ms': 240000, 'played_ms': played}) + '\n')
+
+        build = time.perf_counter()
+        with History(os.path.join(tmp, 'history')) as history:
+            for started, track, played in plays:
+                history.append(started, uris[track], 'track', artists[track % len(artists)],
+                               'artist', 240000, played)
+        build = (time.perf_counter() - build) * 1000
+
+        history = History(os.path.join(tmp, 'history'))
+        results = {
+            'json lines, all': timed(lambda: json_top(text, 0)),
+            'json lines, last half': timed(lambda: json_top(text, middle)),
+            'history log, all': timed(lambda: history.top_tracks()),
+            'history log, last half': timed(lambda: history.top_tracks(since=middle)),
+            'history log, artists': timed(lambda: history.top_artists()),
+        }
+        sizes = (os.path.getsize(text), len(history) * RECORD.size)
+
+    sys.stdout.write(f"{args.plays} plays of {args.tracks} tracks, log written in {build:.0f} ms\n")
+    sys.stdout.write(f"json lines {sizes[0] / 1e6:.1f} MB, history log {sizes[1] / 1e6:.1f} MB\n\n")
+    for name, millis in results.items():
+        sys.stdout.write("%-25s %10.1f ms\n" % (name, millis))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""compare playlist membership lookups: liked.txt line scan vs MembershipCache.
+
+USAGE (from the src directory):
+    python -m benchmarks.membership
+    python -m benchmarks.membership --tracks 50000 --lookups 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from membership import MembershipCache
+
+
+def fake_uris(count, seed=0):
+    """spotify style track uris: 'spotify:track:' + 22 base62 characters"""
+    alphabet = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    rng = random.Random(seed)
+    return [f"spotify:track:{''.join(rng.choices(alphabet, k=22))}" for _ in range(count)]
+
+
+def line_scan(filename, track):
+    """the lookup spotapi used before the membership cache"""
+    with open(filename, 'r') as cached:
+        return next((True for line in cached if track in line), False)
+
+
+def timed(function, queries):
+    start = time.perf_counter()
+    for query in queries:
+        function(query)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    uris = fake_uris(args.tracks)
+    misses = fake_uris(args.lookups, seed=1)
+    hits = random.Random(2).choices(uris, k=args.lookups)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text = os.path.join(tmp, 'liked.txt')
+        with open(text, 'w') as cache:
+            cache.write('\n'.join(uris))
+
+        start = time.perf_counter()
+        with MembershipCache(os.path.join(tmp, 'membership.db')) as cache:
+            cache.replace('playlist', uris)
+            build = (time.perf_counter() - start) * 1000
+
+            results = {
+                'line scan, hit': timed(lambda uri: line_scan(text, uri), hits),
+                'line scan, miss': timed(lambda uri: line_scan(text, uri), misses),
+                'sqlite index, hit': timed(lambda uri: cache.contains('playlist', uri), hits),
+                'sqlite index, miss': timed(lambda uri: cache.contains('playlist', uri), misses),
+            }
+
+        start = time.perf_counter()
+        with MembershipCache(os.path.join(tmp, 'membership.db')) as cache:
+            cache.contains('playlist', misses[0])
+        cold = (time.perf_counter() - start) * 1000
+
+    sys.stdout.write(f"{args.tracks} tracks, {args.lookups} lookups each\n")
+    sys.stdout.write(f"index build: {build:.1f} ms, cold open + lookup: {cold:.2f} ms\n\n")
+    for name, micros in results.items():
+        sys.stdout.write("%-25s %10.1f us/lookup\n" % (name, micros))
+
+
+if __name__ == '__main__':
+    main()
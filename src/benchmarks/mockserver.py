@@ -0,0 +1,271 @@
+"""local stand-in for the spotify endpoints used by the client.
+
+Emulates every endpoint in client.conf closely enough to exercise the
+client: a player whose tracks advance in real time, paged playlists and
+playlist tracks with snapshot_ids, track additions and deletions, and the
+oauth token endpoint, and the multi id track, album and artist catalog
+lookups for numeric ids. It can also add latency, expire access tokens and
+throttle with 429s, and counts every request it answers.
+
+USAGE (from the src directory):
+    python -m benchmarks.mockserver --port 8900 --latency 0.05
+
+    server = MockSpotify(latency=0.02).start()
+    server.config_for()   # client.conf pointing at the mock server
+    server.stop()
+"""
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.fetch import track, artist
+
+API = 'https://api.spotify.com'
+
+# most ids the catalog endpoints accept per request
+CATALOG_LIMITS = {'tracks': 50, 'albums': 20, 'artists': 50}
+ACCOUNTS = 'https://accounts.spotify.com'
+
+
+class MockSpotify():
+
+    def __init__(self, port=0, latency=0.0, playlists=20, tracks=1500, track_seconds=180,
+                 expire_after=0, throttle_every=0, retry_after=1):
+        """ ARGUMENTS:
+                port:            int: port to listen on, 0 picks a free one
+                latency:       float: seconds added to every response
+                playlists:       int: number of playlists the user has
+                tracks:          int: tracks in each playlist
+                track_seconds: float: length of every track in the player
+                expire_after:    int: rotate the access token after this
+                                      many api requests, 0 never
+                throttle_every:  int: answer every nth api request with 429
+                retry_after:     int: Retry-After sent with 429s
+        """
+        self.latency = latency
+        self.track_seconds = track_seconds
+        self.expire_after = expire_after
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self.api_requests = 0
+        self.token = 'token-0'
+        self.started = time.time()
+        self.playlists = {f'playlist{number:02d}': {
+            'name': f'Playlist {number}', 'snapshot': 1,
+            'uris': [f'spotify:track:{number:04d}{index:018d}' for index in range(tracks)]}
+            for number in range(playlists)}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(port={self.port}, latency={self.latency})>"
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def config_for(self, path):
+        """rewrite a client.conf so its endpoints point at this server"""
+        with open(path, 'r') as file:
+            text = file.read()
+        return json.loads(text.replace(API, self.url).replace(ACCOUNTS, self.url))
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests.clear()
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body leave in one buffered write, flushed after
+            # each request, and without nagle a reused connection isn't held
+            # up by the client's delayed ack
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                mock.respond(self, 'GET')
+
+            def do_POST(self):
+                mock.respond(self, 'POST')
+
+            def do_DELETE(self):
+                mock.respond(self, 'DELETE')
+
+        return Handler
+
+    def respond(self, request, method):
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        parts = urlsplit(request.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if parts.path == '/api/token':
+            with self._lock:
+                self.requests['oauth'] += 1
+            return self.send(request, 200, {
+                'access_token': self.token, 'token_type': 'Bearer', 'expires_in': 3600,
+                'scope': 'playlist-modify-private'})
+
+        with self._lock:
+            self.api_requests += 1
+            count = self.api_requests
+            if self.expire_after and count % self.expire_after == 0:
+                self.token = f'token-{count}'
+
+        if request.headers.get('Authorization') != f'Bearer {self.token}':
+            return self.send(request, 401, {'error': {'status': 401, 'message': 'expired'}})
+
+        if self.throttle_every and count % self.throttle_every == 0:
+            headers = {'Retry-After': str(self.retry_after)}
+            return self.send(request, 429, {'error': {'status': 429}}, headers)
+
+        for pattern, name, action in self.routes():
+            match = re.fullmatch(pattern, parts.path)
+            if match and action[0] == method:
+                with self._lock:
+                    self.requests[name] += 1
+                return action[1](request, query, body, *match.groups())
+
+        self.send(request, 404, {'error': {'status': 404, 'message': 'not found'}})
+
+    def routes(self):
+        return [
+            (r'/v1/me/player/currently-playing', 'current_track', ('GET', self.playback)),
+            (r'/v1/me/player', 'playback', ('GET', self.playback)),
+            (r'/v1/me/playlists', 'playlists', ('GET', self.list_playlists)),
+            (r'/v1/playlists/([^/]+)', 'playlist', ('GET', self.get_playlist)),
+            (r'/v1/playlists/([^/]+)/tracks', 'get_tracks', ('GET', self.get_tracks)),
+            (r'/v1/playlists/([^/]+)/tracks', 'add_tracks', ('POST', self.add_tracks)),
+            (r'/v1/playlists/([^/]+)/tracks', 'delete_tracks', ('DELETE', self.delete_tracks)),
+            (r'/v1/(tracks|albums|artists)', 'catalog', ('GET', self.catalog)),
+        ]
+
+    def send(self, request, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    def playback(self, request, query, body):
+        elapsed = time.time() - self.started
+        number = int(elapsed // self.track_seconds)
+        item = track(number)
+        item['duration_ms'] = int(self.track_seconds * 1000)
+        self.send(request, 200, {
+            'device': {'id': 'mock', 'is_active': True, 'name': 'Mock', 'type': 'Computer'},
+            'progress_ms': int(elapsed % self.track_seconds * 1000),
+            'item': item, 'is_playing': True, 'currently_playing_type': 'track'})
+
+    def page(self, items, query, default_limit):
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', default_limit))
+        return {'items': items[offset:offset + limit], 'offset': offset, 'limit': limit,
+                'total': len(items), 'next': None if offset + limit >= len(items) else 'next'}
+
+    def list_playlists(self, request, query, body):
+        items = [{'id': pid, 'name': playlist['name'], 'snapshot_id': str(playlist['snapshot']),
+                  'tracks': {'total': len(playlist['uris'])}}
+                 for pid, playlist in self.playlists.items()]
+        self.send(request, 200, self.page(items, query, 20))
+
+    def track_items(self, playlist):
+        return [{'added_at': '2020-01-01T00:00:00Z', 'track': {
+            'uri': uri, 'name': f'Track {uri[-6:]}', 'duration_ms': 180000,
+            'album': {'name': 'Album', 'uri': 'spotify:album:0'},
+            'artists': [{'name': 'Artist', 'uri': 'spotify:artist:0'}]}}
+            for uri in playlist['uris']]
+
+    def get_playlist(self, request, query, body, pid):
+        playlist = self.playlists.get(pid)
+        if playlist is None:
+            return self.send(request, 404, {'error': {'status': 404}})
+        if query.get('fields') == 'snapshot_id':
+            return self.send(request, 200, {'snapshot_id': str(playlist['snapshot'])})
+        self.send(request, 200, {
+            'id': pid, 'name': playlist['name'], 'snapshot_id': str(playlist['snapshot']),
+            'tracks': self.page(self.track_items(playlist), query, 100)})
+
+    def get_tracks(self, request, query, body, pid):
+        playlist = self.playlists.get(pid)
+        if playlist is None:
+            return self.send(request, 404, {'error': {'status': 404}})
+        self.send(request, 200, self.page(self.track_items(playlist), query, 20))
+
+    def catalog(self, request, query, body, kind):
+        ids = query.get('ids', '').split(',')
+        if len(ids) > CATALOG_LIMITS[kind]:
+            return self.send(request, 400, {'error': {'status': 400, 'message': 'too many ids'}})
+        build = {'tracks': track, 'albums': lambda number: track(number)['album'],
+                 'artists': artist}[kind]
+        self.send(request, 200, {kind: [build(int(id)) if id.isdigit() else None for id in ids]})
+
+    def add_tracks(self, request, query, body, pid):
+        uris = json.loads(body)['uris'] if body else query.get('uris', '').split(',')
+        return self.modify(request, pid, lambda playlist: playlist['uris'].extend(uris))
+
+    def delete_tracks(self, request, query, body, pid):
+        uris = {item['uri'] for item in json.loads(body or b'{"tracks": []}')['tracks']}
+
+        def remove(playlist):
+            playlist['uris'] = [uri for uri in playlist['uris'] if uri not in uris]
+        return self.modify(request, pid, remove)
+
+    def modify(self, request, pid, change):
+        with self._lock:
+            playlist = self.playlists.get(pid)
+            if playlist is not None:
+                change(playlist)
+                playlist['snapshot'] += 1
+        if playlist is None:
+            return self.send(request, 404, {'error': {'status': 404}})
+        self.send(request, 200, {'snapshot_id': str(playlist['snapshot'])})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--expire-after', type=int, default=0)
+    parser.add_argument('--throttle-every', type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockSpotify(port=args.port, latency=args.latency, expire_after=args.expire_after,
+                         throttle_every=args.throttle_every)
+    sys.stdout.write(f"mock spotify listening on {server.url}\n")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""compare raw json responses with the models for a large playlist.
+
+Measures decode time with json and, if installed, orjson, the time to
+build Track objects from the decoded pages, and the memory held once the
+playlist is loaded either way.
+
+USAGE (from the src directory):
+    python -m benchmarks.models
+    python -m benchmarks.models --tracks 20000 --repeat 3
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import models
+from models import Track
+from benchmarks.fetch import playlist_page
+
+
+def pages(tracks):
+    """the encoded pages of a playlist, 100 tracks each, as the api sends them"""
+    page = playlist_page(100)
+    encoded = []
+    for offset in range(0, tracks, 100):
+        for number, item in enumerate(page['items']):
+            track = item['track']
+            track['id'] = f'{offset + number:022d}'
+            track['uri'] = f'spotify:track:{offset + number:022d}'
+        encoded.append(json.dumps(page).encode())
+    return encoded
+
+
+def timed(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def held(function):
+    """bytes still allocated by what function returns"""
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    encoded = pages(args.tracks)
+    raw = lambda: [json.loads(page) for page in encoded]
+    decoded = raw()
+    build = lambda: [track for page in decoded for track in Track.from_items(page['items'])]
+    loaded = lambda: [track for page in encoded
+                      for track in Track.from_items(models.loads(page)['items'])]
+
+    results = {'json decode': timed(raw, args.repeat)}
+    if models.orjson is not None:
+        results['orjson decode'] = timed(lambda: [models.orjson.loads(page) for page in encoded],
+                                         args.repeat)
+    results['build models'] = timed(build, args.repeat)
+    results['decode + models'] = timed(loaded, args.repeat)
+
+    memory = {'raw dicts': held(raw), 'models': held(loaded)}
+
+    size = sum(len(page) for page in encoded)
+    sys.stdout.write(f"{args.tracks} tracks, {size / 1e6:.1f} MB of json, "
+                     f"orjson {'installed' if models.orjson else 'not installed'}\n\n")
+    for name, millis in results.items():
+        sys.stdout.write("%-20s %10.1f ms\n" % (name, millis))
+    for name, size in memory.items():
+        sys.stdout.write("%-20s %10.1f MB held\n" % (name, size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""benchmark the client, the cli and the spotstat loop against MockSpotify.
+
+Measures:
+    latency      per method latency of SpotifyClient calls
+    concurrency  AsyncSpotifyClient throughput at several concurrency levels
+    cold start   wall time of `spotapi.py -h` and `spotapi.py -i` processes
+    spotstat     requests made by the polling loop vs the old two request loop
+
+Results are written as json, and can be compared with an earlier run.
+
+USAGE (from the src directory):
+    python -m benchmarks.run --latency 0.03 --save benchmarks/results/baseline.json
+    python -m benchmarks.run --latency 0.03 --compare benchmarks/results/baseline.json
+    python -m benchmarks.run --only latency concurrency --throttle-every 50 --client-limits
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from benchmarks.mockserver import MockSpotify
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITES = ['latency', 'concurrency', 'cold_start', 'spotstat']
+
+# token bucket used unless --client-limits is given, high enough to never wait
+UNLIMITED = {'rate': 100000, 'burst': 100000}
+
+
+def prepare(server, workdir, client_limits=False):
+    """point the client at the mock server through a rewritten client.conf.
+
+       The client's rate and burst limits are lifted, so the suites measure
+       the client rather than its token bucket, unless client_limits is
+       true to measure throttling on purpose.
+    """
+    config = server.config_for(os.path.join(SRC, 'client.conf'))
+    if not client_limits:
+        config['limits'].update(UNLIMITED)
+    with open(os.path.join(workdir, 'client.conf'), 'w') as file:
+        json.dump(config, file)
+
+    uri_file = os.path.join(workdir, 'current_track_uri')
+    with open(uri_file, 'w') as file:
+        file.write('spotify:track:0')
+
+    os.environ.update({
+        'spotdir': workdir,
+        'spotify_auth_file': os.path.join(workdir, 'auth.json'),
+        'spotify_app': 'benchmark', 'spotify_key': 'secret', 'spotify_access': 'refresh',
+        'current_track_uri': uri_file,
+        'default_playlist': 'playlist00',
+        'spotapi_socket': os.path.join(workdir, 'spotapi.sock')})
+
+
+def summary(samples):
+    """milliseconds summary of a list of durations in seconds"""
+    ordered = sorted(sample * 1000 for sample in samples)
+    return {
+        'mean_ms': round(statistics.mean(ordered), 3),
+        'p50_ms': round(ordered[len(ordered) // 2], 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3)}
+
+
+def client():
+    from client import SpotifyClient
+
+    api = SpotifyClient(client='benchmark', secret='secret', redirect='http://127.0.0.1')
+    api.refresh = 'refresh'
+    api.load_access()
+    return api
+
+
+def latency(server, repeat):
+    api = client()
+    calls = {
+        'get_current_track': api.get_current_track,
+        'get_playback_status': api.get_playback_status,
+        'get_playlists': api.get_playlists,
+        'get_playlist': lambda: api.get_playlist('playlist01'),
+        'get_snapshot_id': lambda: api.get_snapshot_id('playlist01'),
+        'get_playlist_tracks': lambda: api.get_playlist_tracks('playlist01'),
+        'add_track': lambda: api.add_track('playlist02', 'spotify:track:benchmark'),
+        'delete_track': lambda: api.delete_track('playlist02', 'spotify:track:benchmark'),
+        'iter_playlist_tracks': lambda: list(api.iter_playlist_tracks('playlist01')),
+    }
+    results = {}
+    with api:
+        for name, call in calls.items():
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                call()
+                samples.append(time.perf_counter() - start)
+            results[name] = summary(samples)
+    return results
+
+
+def concurrency(server, requests, levels=(1, 4, 16)):
+    from async_client import AsyncSpotifyClient
+
+    async def run(level):
+        async with AsyncSpotifyClient(client='benchmark', secret='secret', concurrency=level) as api:
+            api.refresh = 'refresh'
+            await api.run('load_access')
+            start = time.perf_counter()
+            await api.gather(*(api.get_playlist(f'playlist{number % 20:02d}')
+                               for number in range(requests)))
+            return time.perf_counter() - start
+
+    results = {}
+    for level in levels:
+        elapsed = asyncio.run(run(level))
+        results[f'concurrency_{level}'] = {
+            'requests': requests, 'seconds': round(elapsed, 3),
+            'requests_per_second': round(requests / elapsed, 1)}
+    return results
+
+
+def cold_start(server, runs):
+    results = {}
+    for flag in ('-h', '-i'):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, 'spotapi.py', flag], cwd=SRC, env=os.environ,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            samples.append(time.perf_counter() - start)
+        results[f'spotapi {flag}'] = summary(samples)
+    return results
+
+
+def spotstat(server, seconds):
+    """count requests of the polling loop and of the old loop over the same tracks"""
+    from poller import PlaybackPoller
+
+    api = client()
+    with api:
+        server.reset_counts()
+        poller = PlaybackPoller(api, min_interval=0.2, max_interval=server.track_seconds, settle=1)
+        deadline = time.monotonic() + seconds
+        tracks = 0
+        while time.monotonic() < deadline:
+            data, changes, interval = poller.poll()
+            tracks += 'track' in changes
+            time.sleep(min(interval, max(0, deadline - time.monotonic())))
+        adaptive = sum(server.requests.values())
+
+        # the loop spotstat ran before the poller: two requests per track,
+        # then sleep until two seconds after the predicted end
+        server.reset_counts()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            api.get_current_track()
+            remaining = api.get_track_duration(api.get_playback_status()) / 1000
+            time.sleep(min(remaining + 2, max(0, deadline - time.monotonic())))
+        legacy = sum(server.requests.values())
+
+    return {'seconds': seconds, 'track_seconds': server.track_seconds, 'tracks_seen': tracks,
+            'adaptive_requests': adaptive, 'legacy_requests': legacy}
+
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)):
+            yield f'{prefix}{key}', value
+
+
+def compare(results, baseline):
+    """print every numeric metric next to its baseline value"""
+    previous = dict(flatten(baseline['results']))
+    for name, value in flatten(results['results']):
+        if name in previous and previous[name]:
+            change = (value - previous[name]) / previous[name] * 100
+            sys.stdout.write("%-55s %12s %12s %+8.1f%%\n" % (name, previous[name], value, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=SUITES, default=SUITES)
+    parser.add_argument('--latency', type=float, default=0.02, help='mock latency, seconds')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200, help='requests per concurrency level')
+    parser.add_argument('--runs', type=int, default=5, help='cold start runs')
+    parser.add_argument('--loop-seconds', type=float, default=20)
+    parser.add_argument('--track-seconds', type=float, default=5)
+    parser.add_argument('--expire-after', type=int, default=0)
+    parser.add_argument('--throttle-every', type=int, default=0)
+    parser.add_argument('--client-limits', action='store_true',
+                        help="keep client.conf's rate and burst limits")
+    parser.add_argument('--save', default=os.path.join(SRC, 'benchmarks', 'results', 'latest.json'))
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    server = MockSpotify(latency=args.latency, track_seconds=args.track_seconds,
+                         expire_after=args.expire_after, throttle_every=args.throttle_every).start()
+    suites = {
+        'latency': lambda: latency(server, args.repeat),
+        'concurrency': lambda: concurrency(server, args.requests),
+        'cold_start': lambda: cold_start(server, args.runs),
+        'spotstat': lambda: spotstat(server, args.loop_seconds),
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare(server, workdir, args.client_limits)
+        results = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'settings': vars(args),
+            'results': {name: suites[name]() for name in args.only}}
+    server.stop()
+
+    sys.stdout.write(json.dumps(results['results'], indent=2) + '\n')
+    os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+    with open(args.save, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            sys.stdout.write(f"\ncompared with {args.compare}\n")
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
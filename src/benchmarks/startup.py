@@ -0,0 +1,92 @@
+"""measure the import cost of the spotapi cli against a time budget.
+
+The tmux keybindings run `spotapi -i` and `spotapi -l` on every key press,
+so everything a command imports before it answers is paid each time. When
+spotstat isn't running they run directly: -l and -u reply before the
+client is imported, -i needs the client and with it requests, which is
+most of its cost. This runs the interpreter with -X importtime for each
+path, totals the top level imports and lists the slowest modules.
+
+USAGE (from the src directory):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --only info --runs 10
+    python -m benchmarks.startup --module spotstat --budget 300
+
+Exits with status 1 when the median import time of a path exceeds its
+budget.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+# modules each direct mode command imports before it answers, and its
+# budget in milliseconds. importing requests alone takes about 100 ms.
+PATHS = {
+    'info': (('spotapi', 'client'), 200),
+    'like': (('spotapi', 'journal', 'membership'), 120),
+}
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(modules):
+    """run a fresh interpreter importing modules, return {package: cumulative_us}"""
+    env = {**os.environ, 'spotdir': os.environ.get('spotdir', SRC)}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+        cwd=SRC, env=env, capture_output=True, text=True)
+
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, package = line[len('import time:'):].split('|')
+        name = package.rstrip()[1:]
+        # nested imports are indented; only top level entries are summed
+        if not name.startswith(' '):
+            profile[name] = int(cumulative)
+    return profile
+
+
+def measure(modules, runs, budget, top):
+    """print the median import time of modules, true if it fits the budget"""
+    totals, slowest = [], {}
+    for _ in range(runs):
+        profile = import_profile(modules)
+        totals.append(sum(profile.values()) / 1000)
+        for name, micros in profile.items():
+            slowest[name] = max(slowest.get(name, 0), micros)
+
+    median = statistics.median(totals)
+    sys.stdout.write(f"import {', '.join(modules)}: median {median:.1f} ms over {runs} runs "
+                     f"(budget {budget:.0f} ms)\n\n")
+    for name, micros in sorted(slowest.items(), key=lambda item: -item[1])[:top]:
+        sys.stdout.write("%-40s %8.1f ms\n" % (name, micros / 1000))
+    sys.stdout.write("\n")
+    return median <= budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=PATHS, default=list(PATHS))
+    parser.add_argument('--module', nargs='+', help='measure these modules instead')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, help='milliseconds, overrides the defaults')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.module:
+        paths = [(args.module, args.budget or PATHS['info'][1])]
+    else:
+        paths = [(modules, args.budget or budget) for modules, budget in
+                 (PATHS[name] for name in args.only)]
+    fits = [measure(modules, args.runs, budget, args.top) for modules, budget in paths]
+    sys.exit(int(not all(fits)))
+
+
+if __name__ == '__main__':
+    main()
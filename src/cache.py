@@ -0,0 +1,151 @@
+"""time limited response cache for the SpotifyClient's GET requests
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_DIRECTORY = '/tmp/spotify-api/http-cache'
+
+# returned by lookups that miss, since None is a valid cached value
+MISS = object()
+
+
+class ResponseCache():
+
+    def __init__(self, ttls, max_entries=256, directory=None):
+        """ LRU cache of decoded api responses with a time to live for each
+            endpoint.
+
+            Entries live in memory, evicting the least recently used entry
+            once max_entries is reached. If a directory is given, entries
+            are also written there as json files, so short lived spotapi
+            processes share each other's responses.
+
+            Every entry belongs to a tag, normally the id of the playlist the
+            response describes, so that modifying a playlist can drop every
+            response about it with invalidate(tag).
+
+            ARGUMENTS:
+                ttls:        dict: maps endpoint names to seconds an entry
+                                   stays valid. Endpoints missing or set to
+                                   0 are never cached.
+                max_entries:  int: entries held in memory
+                directory:    str: optional directory for the disk tier
+
+            USAGE:
+                cache = ResponseCache({'playlists': 300}, directory=CACHE_DIRECTORY)
+                client = SpotifyClient(client=app, secret=key, cache=cache)
+        """
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.counts = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f"<class {type(self).__name__}(entries={len(self.entries)}, "
+                f"max_entries={self.max_entries}, directory={self.directory})>")
+
+    def ttl(self, name):
+        return self.ttls.get(name, 0)
+
+    def get(self, tag, key):
+        """return the cached value or MISS"""
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get((tag, key))
+            if entry and entry[0] > now:
+                self.entries.move_to_end((tag, key))
+                self.counts['hits'] += 1
+                return entry[1]
+            self.entries.pop((tag, key), None)
+
+        entry = self.read(tag, key, now)
+        with self._lock:
+            if entry is None:
+                self.counts['misses'] += 1
+                return MISS
+            self.counts['disk_hits'] += 1
+            self.remember(tag, key, *entry)
+        return entry[1]
+
+    def put(self, tag, key, value, ttl):
+        """cache value for ttl seconds"""
+        if ttl <= 0:
+            return
+        expires = time.time() + ttl
+        with self._lock:
+            self.remember(tag, key, expires, value)
+        self.write(tag, key, expires, value)
+
+    def invalidate(self, tag):
+        """drop every entry belonging to tag"""
+        with self._lock:
+            for entry in [entry for entry in self.entries if entry[0] == tag]:
+                del self.entries[entry]
+            self.counts['invalidations'] += 1
+        if self.directory:
+            shutil.rmtree(self.path(tag), ignore_errors=True)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, 'entries': len(self.entries)}
+
+    def remember(self, tag, key, expires, value):
+        """store an entry in memory, evicting the oldest. caller holds the lock"""
+        self.entries[(tag, key)] = (expires, value)
+        self.entries.move_to_end((tag, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def path(self, tag, key=None):
+        folder = os.path.join(self.directory, hashlib.sha1(tag.encode()).hexdigest()[:16])
+        if key is None:
+            return folder
+        return os.path.join(folder, f'{hashlib.sha1(key.encode()).hexdigest()}.json')
+
+    def read(self, tag, key, now):
+        """(expires, value) from the disk tier, or None"""
+        if not self.directory:
+            return None
+        filename = self.path(tag, key)
+        try:
+            with open(filename, 'r') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if entry['key'] != key or entry['expires'] <= now:
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+            return None
+        return entry['expires'], entry['value']
+
+    def write(self, tag, key, expires, value):
+        """atomically store an entry in the disk tier"""
+        if not self.directory:
+            return
+        folder = self.path(tag)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=folder, prefix='.entry-')
+            with os.fdopen(descriptor, 'w') as file:
+                json.dump({'key': key, 'expires': expires, 'value': value}, file)
+            os.replace(temporary, self.path(tag, key))
+
+        except OSError as error:
+            print(error)
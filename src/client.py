@@ -1,24 +1,39 @@
 import os
 import re
 import json
+import time
 import base64
-import webbrowser as browser
-from functools import partial
+import threading
+from collections import deque
+from functools import partial, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from requests import exceptions
-from urllib.parse import urlencode
-from requests_html import HTMLSession
+from urllib.parse import urlencode, urlsplit
+from transport import ConnectionPool
+from scheduler import RequestScheduler
+from tokens import TokenManager
+from singleflight import SingleFlight
+from loader import DataLoader
+from cache import MISS
+from models import loads, Track, Playlist, PlaybackState
 
-from iter.accessories import fetch
-from system.tools import get_future
+from utilities import compile_path, get_future, chunked, unique
 
 here = os.environ.get('spotdir')
 authorizaton_file = os.environ.get('spotify_auth_file')
 
-with open(f'{here}/client.conf', 'r') as configuration:
-    config = json.load(configuration)
+# how long a playlist's last seen snapshot_id is remembered by the response cache
+SNAPSHOT_TTL = 86400
 
-HEADERS = config['headers']
-endpoints = config['endpoints']
+track_length = compile_path('item.duration_ms')
+track_progress = compile_path('progress_ms')
+
+# maximum number of uris the playlist tracks endpoint accepts per request
+TRACK_LIMIT = 100
+
+# maximum number of ids each catalog endpoint accepts per request, used
+# when client.conf doesn't set them
+CATALOG_LIMITS = {'tracks': 50, 'albums': 20, 'artists': 50}
 
 # scopes are only neccessary when first initalizing app permissions
 scopes = [
@@ -27,6 +42,75 @@ scopes = [
 ]
 
 
+@lru_cache(maxsize=None)
+def load_config():
+    """read client.conf on first use instead of at import time"""
+    with open(f'{here}/client.conf', 'r') as configuration:
+        return json.load(configuration)
+
+
+def endpoints():
+    """api endpoint urls from client.conf"""
+    return load_config()['endpoints']
+
+
+def headers():
+    """authorization header templates from client.conf"""
+    return load_config()['headers']
+
+
+def limits():
+    """rate limit and retry settings from client.conf"""
+    return load_config()['limits']
+
+
+@lru_cache(maxsize=None)
+def endpoint_patterns():
+    """regular expressions matching the urls of every configured endpoint"""
+    patterns = []
+    for name, url in endpoints().items():
+        pattern = re.escape(url).replace(re.escape('{0}'), '[^/]+')
+        patterns.append((name, re.compile(f'{pattern}$')))
+    return patterns
+
+
+def cache_ttls():
+    """seconds each endpoint's responses may be cached, from client.conf"""
+    return load_config()['cache']
+
+
+def cache_tag(url, name):
+    """response cache tag for a url: its playlist id, or the endpoint name"""
+    match = re.search(r'/playlists/([^/?]+)', url)
+    return match.group(1) if match else name
+
+
+@lru_cache(maxsize=256)
+def endpoint_name(url):
+    """name of the client.conf endpoint a url belongs to, or its path"""
+    parts = urlsplit(url)
+    address = f'{parts.scheme}://{parts.netloc}{parts.path}'
+    for name, pattern in endpoint_patterns():
+        if pattern.match(address):
+            return name
+    return parts.path
+
+
+class IncompleteListing(Exception):
+    """a page of a paged endpoint couldn't be downloaded, so the items
+       received so far are not the complete list"""
+
+    def __init__(self, endpoint, offset):
+        super().__init__(f'failed to download {endpoint} at offset {offset}')
+        self.endpoint = endpoint
+        self.offset = offset
+
+
+def catalog_id(uri):
+    """the id of a spotify uri such as spotify:track:<id>, ids are returned as is"""
+    return uri.rsplit(':', 1)[-1]
+
+
 def base64encode(urldata):
     """encode text to binary as required by spotify url scheme"""
     dataBytes = urldata.encode('ascii')
@@ -36,7 +120,9 @@ def base64encode(urldata):
 
 class SpotifyClient():
 
-    def __init__(self, client=None, secret=None, csrf=None, redirect=None, scope=None):
+    def __init__(self, client=None, secret=None, csrf=None, redirect=None, scope=None,
+                 transport=None, pool_sizes=None, scheduler=None, token_file=None,
+                 cache=None, hooks=None):
         """ Spotify Api Interface to query user's account for currently playing 
             track data. The scope can be modified to accommadate other endpoints 
             by adding the appropiate authorization scopes to the scope list. 
@@ -72,52 +158,204 @@ class SpotifyClient():
                 scope   list: a list of the domains within the spotify api this app
                               will have permission to access. Only neccessary when 
                               first initalizing app permissions
+
+                transport  ConnectionPool: keep-alive connection pool to send
+                              requests through. Optional; pass one in to share
+                              connections between several clients. A pool
+                              created by the client is closed by client.close().
+
+                pool_sizes dict: connections kept alive per host for a pool
+                              created by the client, e.g. 
+                              {'api.spotify.com': 20}. Optional.
+
+                scheduler  RequestScheduler: rate limiter and retry policy
+                              applied to every request. Optional; by default
+                              one is built from the limits in client.conf.
+                              Pass one in to share a rate limit between
+                              several clients.
+
+                token_file str: shared authorization file, defaults to the
+                              spotify_auth_file environment variable. See
+                              TokenManager.
+
+                cache ResponseCache: optional cache for GET responses. Entries
+                              about a playlist are dropped when the client
+                              modifies it or sees its snapshot_id change.
+
+                hooks      list: callables receiving an event dict after every
+                              request and token refresh, e.g. a Metrics
+                              instance. Hooks can also be appended later to
+                              client.hooks.
+
+            One client can be shared by any number of threads. Identical GETs
+            made at the same time share a single request (see SingleFlight),
+            and when several requests are refused with a 401 at once the
+            token is refreshed only once. Track, album and artist lookups
+            from every thread are batched into multi id requests (see
+            DataLoader and get_tracks).
+
+            The client holds its connections open between calls, so close it
+            when finished, or use it as a context manager:
+
+                with SpotifyClient(client=app, secret=key) as api:
+                    api.get_current_track()
         """
-        self.session = HTMLSession()
+        self.token = None
+        self.expires = 0
+        self.refresh = None
+        self.authorized = {}
+        self.snapshots = {}
+        self.cache = cache
+        self.hooks = list(hooks or [])
+        self.flight = SingleFlight()
+        self._token_lock = threading.RLock()
+        self.tokens = TokenManager(token_file or authorizaton_file)
+        self.owns_transport = transport is None
+        self.transport = transport or ConnectionPool(pool_sizes)
+        settings = limits()
+        self.timeout = settings['timeout']
+        self.scheduler = scheduler or RequestScheduler(
+            rate=settings['rate'], burst=settings['burst'], retries=settings['retries'],
+            endpoint_limits=settings['endpoints'])
+        batch_sizes = {**CATALOG_LIMITS, **settings.get('batch', {})}
+        self.loaders = {kind: DataLoader(partial(self.fetch_catalog, kind), size)
+                        for kind, size in batch_sizes.items()}
         self.state = csrf
         self.scope = scope
         self.app_id = client
         self.secret = secret
         self.redirect = redirect
         self.auth_id = base64encode(f'{self.app_id}:{self.secret}')
-        self.grant = {**HEADERS['grant'], "redirect_uri": self.redirect}
-        self.basic = {**HEADERS['basic'], 'Authorization': f"Basic {self.auth_id}"}
-        self.get = partial(self.api_connect, 'get')
+        self.grant = {**headers()['grant'], "redirect_uri": self.redirect}
+        self.basic = {**headers()['basic'], 'Authorization': f"Basic {self.auth_id}"}
         self.post = partial(self.api_connect, 'post')
         self.delete = partial(self.api_connect, 'delete')
 
     def __repr__(self):
-        return f"<class {type(self).__name__}(scope={', '.join(self.scope)})>"
+        return f"<class {type(self).__name__}(scope={', '.join(self.scope or [])})>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """release pooled connections held by the client"""
+        for loader in self.loaders.values():
+            loader.close()
+        if self.owns_transport:
+            self.transport.close()
 
     def api_connect(self, method, endpoint, **kwargs):
-        """connect to the spotify api for data manipulation and retrieval"""
-        with self.session as connection:
-            api = getattr(connection, method)
-            try:
-                response = api(endpoint, **kwargs)
+        """connect to the spotify api for data manipulation and retrieval.
+
+           Requests are rate limited and retried by the client's scheduler.
+           A 401 refreshes the access token, then the request is retried once
+           with the new token. Returns the decoded json, {} when the api
+           sends no content, or None if the request failed.
+
+           When the client has hooks, each of them is called with an event
+           describing the request: endpoint, method, final status, attempts
+           made, whether the token was refused, bytes received, error name
+           and total seconds including retries.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if self.expires and not self.tokens.valid({'expires_at': self.expires}):
+            self.load_access()
+            kwargs['headers'] = {**kwargs.get('headers', {}), **self.authorized}
+
+        name = endpoint_name(endpoint)
+        # the event is only built when hooks will see it
+        started = time.perf_counter() if self.hooks else None
+        attempts, status, refreshed, size, failure = 0, None, False, 0, None
+
+        def send():
+            nonlocal attempts
+            attempts += 1
+            return self.transport.request(method, endpoint, **kwargs)
+
+        result = None
+        try:
+            for attempt in range(2):
+                response = self.scheduler.execute(send, name, method)
+                status = response.status_code
+                if response.status_code == 401 and not attempt:
+                    refreshed = True
+                    self.refresh_access_token(rejected=kwargs.get('headers', {}).get('Authorization'))
+                    kwargs['headers'] = {**kwargs.get('headers', {}), **self.authorized}
+                    continue
                 response.raise_for_status()
-                return response.json()
+                size = len(response.content)
+                result = loads(response.content) if response.content else {}
+                break
+
+        except (exceptions.RequestException, ValueError) as error:
+            failure = type(error).__name__
+            print(error)
+
+        if started is not None:
+            self.emit({'kind': 'request', 'endpoint': name, 'method': method, 'status': status,
+                       'attempts': attempts, 'refreshed': refreshed, 'bytes': size,
+                       'error': failure, 'seconds': time.perf_counter() - started})
+        return result
+
+    def emit(self, event):
+        """pass an event to every hook, a failing hook never fails the request"""
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception as error:
+                print(f'request hook {hook!r} failed: {error}')
+
+    def get(self, endpoint, cached=True, **kwargs):
+        """GET request, answered from the response cache when possible.
 
-            except exceptions.RequestException as error:
-                if response.status_code == 401:
-                    self.refresh_access_token()
-                    return 0
-                print(error)
+           Responses are cached for the ttl client.conf gives the endpoint,
+           keyed by url and query parameters. Concurrent calls for the same
+           key share one request. Pass cached=False to always make a new
+           request to the api.
+        """
+        if not cached:
+            return self.api_connect('get', endpoint, **kwargs)
+
+        name = endpoint_name(endpoint)
+        params = kwargs.get('params') or {}
+        key = f"{endpoint}?{urlencode(sorted(params.items()))}"
+        send = partial(self.flight.do, key, partial(self.api_connect, 'get', endpoint, **kwargs))
+        if self.cache is None or not self.cache.ttl(name):
+            return send()
+
+        tag = cache_tag(endpoint, name)
+        value = self.cache.get(tag, key)
+        if value is MISS:
+            value = send()
+            if value is not None:
+                self.cache.put(tag, key, value, self.cache.ttl(name))
+        return value
+
+    def invalidate(self, playlist_id, snapshot_id=None):
+        """drop cached responses about a playlist that has changed"""
+        if self.cache is not None:
+            self.cache.invalidate(playlist_id)
+            self.cache.invalidate('playlists')
+            if snapshot_id:
+                self.cache.put('snapshots', playlist_id, snapshot_id, SNAPSHOT_TTL)
 
     def auth_api_connect(self, method, endpoint, **kwargs):
         """connect to the spotify api for authorization requests"""
-        with self.session as connection:
-            api = getattr(connection, method)
-            try:
-                response = api(endpoint, **kwargs)
-                response.raise_for_status()
-                content = response.headers.get('content-type')
-                if content == 'application/json':
-                    return response.json()
-                return response.url
+        kwargs.setdefault('timeout', self.timeout)
+        send = partial(self.transport.request, method, endpoint, **kwargs)
+        try:
+            response = self.scheduler.execute(send, endpoint_name(endpoint), method)
+            response.raise_for_status()
+            content = response.headers.get('content-type')
+            if content == 'application/json':
+                return response.json()
+            return response.url
 
-            except exceptions.RequestException as error:
-                print(error)
+        except exceptions.RequestException as error:
+            print(error)
 
     def authorization_url(self):
         """format and encode the authorization url"""
@@ -129,7 +367,7 @@ class SpotifyClient():
             'state': self.state,
             'show_dialog': False}
 
-        return f"{endpoints['authorize']}?{urlencode(payload)}"
+        return f"{endpoints()['authorize']}?{urlencode(payload)}"
 
     def authorize_app(self):
         """get authorization code for the app.
@@ -152,6 +390,8 @@ class SpotifyClient():
             is granted, it can be refreshed indefinitely if you store the refresh 
             token between application runs. 
         """
+        import webbrowser as browser
+
         endpoint = self.authorization_url()
         url = self.auth_api_connect('get', endpoint)
         browser.open(url)
@@ -171,17 +411,16 @@ class SpotifyClient():
            USAGE:
                 client.generate_access_token(code=authcode)
         """
-        endpoint = endpoints['oauth']
+        endpoint = endpoints()['oauth']
         payload = urlencode({**self.grant, "code": code})
         access = self.auth_api_connect('post', endpoint, headers=self.basic, params=payload)
-        self.token = access['access_token']
-        self.expires = get_future(access['expires_in'])
         self.refresh = access['refresh_token']
-        self.authorized = {"Authorization": f"Bearer {self.token}"}
-        self.write_access()
-        self.store_expiration()
+        session = self.session_from(access)
+        with self.tokens.locked():
+            self.tokens.write(session)
+        self.use_session(session)
 
-    def refresh_access_token(self):
+    def refresh_access_token(self, rejected=None):
         """Send a request to refresh the access token after it expires. 
 
            Once you have the initial access token, you should only need to use 
@@ -197,30 +436,61 @@ class SpotifyClient():
                             api when the app was granted the initial access token. 
                             It is stored in the attribute client.refresh.
 
+                rejected: str: optional, the authorization header a request
+                            was refused with. If another thread has already
+                            replaced it, nothing more is done.
+
+            The refresh is coordinated through the shared authorization file:
+            if another process already replaced the token this client holds,
+            that token is used and no request is made.
+
             USAGE:
-                client.refresh_access_token(token=self.refresh) 
+                client.refresh_access_token() 
         """
-        endpoint = endpoints['oauth']
-        payload = urlencode({**HEADERS['renew'], 'refresh_token': self.refresh})
+        with self._token_lock:
+            current = self.authorized.get('Authorization')
+            if rejected is not None and rejected != current:
+                return
+            session = self.tokens.refresh(self.request_access_token, rejected=current)
+            if session:
+                self.use_session(session)
+
+    def load_access(self):
+        """use the shared access token, refreshing it if it is about to expire"""
+        with self._token_lock:
+            session = self.tokens.current()
+            if session:
+                self.use_session(session)
+            else:
+                session = self.tokens.refresh(self.request_access_token)
+                if session:
+                    self.use_session(session)
+            return session
+
+    def request_access_token(self):
+        """ask the oauth endpoint for a new access token, see refresh_access_token"""
+        endpoint = endpoints()['oauth']
+        payload = urlencode({**headers()['renew'], 'refresh_token': self.refresh})
         access = self.auth_api_connect('post', endpoint, headers=self.basic, params=payload)
-        self.token = access['access_token']
-        self.expires = get_future(access['expires_in'])
-        self.authorized = {"Authorization": f"Bearer {self.token}"}
-        if 'refresh_token' in access:
-            self.refresh['refresh_token'] = access['refresh_token']
-        self.write_access()
-        self.store_expiration()
-
-    def write_access(self):
-        """make authorization credentials accessible to other processes"""
-        current_session = {'header': self.authorized, 'refresh_token': self.refresh}
-        with open(authorizaton_file, 'w') as output:
-            json.dump(current_session, output)
-
-    def store_expiration(self):
-        """store token expiration time for future checks"""
-        with open('/tmp/spotify-api/auth-expiration.txt', 'w') as file:
-            file.write(self.expires)
+        if self.hooks:
+            self.emit({'kind': 'refresh', 'ok': bool(access)})
+        if access:
+            return self.session_from(access)
+
+    def session_from(self, access):
+        """shared session record for an oauth endpoint response"""
+        return {
+            'header': {"Authorization": f"Bearer {access['access_token']}"},
+            'refresh_token': access.get('refresh_token', self.refresh),
+            'expires_at': get_future(access['expires_in'])}
+
+    def use_session(self, session):
+        """adopt the access token of a shared session record"""
+        with self._token_lock:
+            self.authorized = session['header']
+            self.token = self.authorized['Authorization'].split()[-1]
+            self.expires = session['expires_at']
+            self.refresh = session.get('refresh_token') or self.refresh
 
     def get_current_track(self):
         """query the currently-playing endpoint for data pertaining to the
@@ -234,7 +504,7 @@ class SpotifyClient():
             USAGE:
                 client.get_current_track(access=self.token)
         """
-        endpoint = endpoints['current_track']
+        endpoint = endpoints()['current_track']
         return self.get(endpoint, headers=self.authorized)
 
     def get_playback_status(self):
@@ -249,30 +519,294 @@ class SpotifyClient():
             USAGE:
                 client.get_playback(access=self.token)
         """
-        endpoint = endpoints['playback']
+        endpoint = endpoints()['playback']
         return self.get(endpoint, headers=self.authorized)
 
-    def get_playlists(self):
+    def get_playlists(self, offset=0, limit=50):
         """returns a json object od data pertaining to user's playlists"""
-        endpoint = endpoints['playlists']
-        return self.get(endpoint, headers=self.authorized)
+        endpoint = endpoints()['playlists']
+        params = {'offset': offset, 'limit': limit}
+        return self.get(endpoint, headers=self.authorized, params=params)
 
-    def get_playlist(self, playlist_id):
+    def get_playlist(self, playlist_id, fields=None, cached=True):
         """returns information about a specific playlist in json format"""
-        endpoint = endpoints['playlist'].format(playlist_id)
-        return self.get(endpoint, headers=self.authorized)
+        endpoint = endpoints()['playlist'].format(playlist_id)
+        params = {'fields': fields} if fields else None
+        return self.get(endpoint, cached=cached, headers=self.authorized, params=params)
+
+    def get_snapshot_id(self, playlist_id):
+        """returns the playlist's current snapshot_id.
+
+           Only the snapshot_id field is requested, which makes this a cheap
+           way to find out whether a playlist changed since it was cached.
+           It always goes to the api, and drops the playlist's cached
+           responses if the snapshot_id isn't the last one the cache saw.
+        """
+        data = self.get_playlist(playlist_id, fields='snapshot_id', cached=False)
+        if data:
+            snapshot_id = data['snapshot_id']
+            self.snapshots[playlist_id] = snapshot_id
+            if self.cache is not None and self.cache.get('snapshots', playlist_id) != snapshot_id:
+                self.invalidate(playlist_id, snapshot_id)
+            return snapshot_id
+
+    def get_playlist_tracks(self, playlist_id, offset=0, limit=100, fields=None):
+        """returns one page of a playlist's tracks in json format"""
+        endpoint = endpoints()['manage_tracks'].format(playlist_id)
+        params = {'offset': offset, 'limit': limit}
+        if fields:
+            params['fields'] = fields
+        return self.get(endpoint, headers=self.authorized, params=params)
+
+    def paginate(self, endpoint, limit, fields=None, prefetch=4, cached=True):
+        """generator yielding every item of a paged endpoint.
+
+           The first page reports the total number of items, so the offsets
+           of all remaining pages are known up front. Up to `prefetch` of
+           those pages are downloaded concurrently ahead of the consumer,
+           and items are still yielded in order. If the response carries no
+           total, the `next` links are followed one page at a time.
+
+           If any page fails to download, IncompleteListing is raised, so a
+           partial listing is never mistaken for the complete one.
+
+           ARGUMENTS:
+                endpoint: str: url of a paged endpoint
+                limit:    int: items per page, the endpoint's maximum is best
+                fields:   str: optional spotify fields filter, e.g.
+                               'items(track(uri,name))'. total and next are
+                               added automatically.
+                prefetch: int: number of pages downloaded ahead, 0 disables
+                cached:  bool: False bypasses the response cache
+        """
+        if fields:
+            fields = f'{fields},total,next'
+
+        def page(offset):
+            params = {'offset': offset, 'limit': limit}
+            if fields:
+                params['fields'] = fields
+            return self.get(endpoint, cached=cached, headers=self.authorized, params=params)
+
+        first = page(0)
+        if not first:
+            raise IncompleteListing(endpoint, 0)
+        yield from first['items']
+
+        if 'total' not in first:
+            following, received = first.get('next'), len(first['items'])
+            while following:
+                data = self.get(following, cached=cached, headers=self.authorized)
+                if not data:
+                    raise IncompleteListing(endpoint, received)
+                yield from data['items']
+                following, received = data.get('next'), received + len(data['items'])
+            return
+
+        offsets = iter(range(limit, first['total'], limit))
+        if not prefetch:
+            for offset in offsets:
+                data = page(offset)
+                if not data:
+                    raise IncompleteListing(endpoint, offset)
+                yield from data['items']
+            return
+
+        with ThreadPoolExecutor(max_workers=prefetch) as pool:
+            pending = deque((offset, pool.submit(page, offset))
+                            for _, offset in zip(range(prefetch), offsets))
+            try:
+                while pending:
+                    offset, future = pending.popleft()
+                    data = future.result()
+                    if not data:
+                        raise IncompleteListing(endpoint, offset)
+                    following = next(offsets, None)
+                    if following is not None:
+                        pending.append((following, pool.submit(page, following)))
+                    yield from data['items']
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def iter_playlists(self, prefetch=4, cached=True):
+        """iterate over all of the user's playlists, following every page.
+           Raises IncompleteListing if a page fails, see paginate"""
+        endpoint = endpoints()['playlists']
+        return self.paginate(endpoint, 50, prefetch=prefetch, cached=cached)
+
+    def iter_playlist_tracks(self, playlist_id, fields=None, prefetch=4, cached=True):
+        """iterate over every track in a playlist, following every page.
+           Raises IncompleteListing if a page fails, see paginate.
+
+           USAGE:
+                uris = {item['track']['uri'] for item in
+                        client.iter_playlist_tracks(pid, fields='items(track(uri))')}
+        """
+        endpoint = endpoints()['manage_tracks'].format(playlist_id)
+        return self.paginate(endpoint, 100, fields=fields, prefetch=prefetch, cached=cached)
+
+    def fetch_catalog(self, kind, ids):
+        """one multi id request to a catalog endpoint, returns {id: object}"""
+        endpoint = endpoints()[kind]
+        data = self.get(endpoint, cached=False, headers=self.authorized, params={'ids': ','.join(ids)})
+        return {item['id']: item for item in (data or {}).get(kind) or [] if item}
+
+    def get_tracks(self, ids):
+        """track objects for any number of track ids or uris, in order.
+
+           Lookups go through a DataLoader: ids are deduplicated, sent 50 per
+           request together with ids other threads asked for at the same
+           time, and remembered afterwards. Unknown ids, and ids whose
+           request failed, give None.
+
+           USAGE:
+                names = [track['name'] for track in client.get_tracks(uris) if track]
+        """
+        return self.loaders['tracks'].load_many([catalog_id(uri) for uri in ids])
+
+    def get_albums(self, ids):
+        """album objects for any number of album ids or uris, 20 per request"""
+        return self.loaders['albums'].load_many([catalog_id(uri) for uri in ids])
+
+    def get_artists(self, ids):
+        """artist objects for any number of artist ids or uris, 50 per request"""
+        return self.loaders['artists'].load_many([catalog_id(uri) for uri in ids])
+
+    def get_track(self, id):
+        """a single track, batched with lookups made by other threads"""
+        return self.loaders['tracks'].load(catalog_id(id)).result()
+
+    def get_album(self, id):
+        return self.loaders['albums'].load(catalog_id(id)).result()
+
+    def get_artist(self, id):
+        return self.loaders['artists'].load(catalog_id(id)).result()
+
+    def playback_state(self):
+        """the player state as a PlaybackState, None when nothing is playing"""
+        return PlaybackState.from_json(self.get_playback_status())
+
+    def user_playlists(self):
+        """all of the user's playlists as Playlist objects"""
+        return [Playlist.from_json(item) for item in self.iter_playlists()]
+
+    def playlist_tracks(self, playlist_id, keep=False):
+        """every track in a playlist as Track objects.
+
+           Only the fields the models hold survive, so a large playlist
+           takes a fraction of the memory of the raw pages. Pass keep=True
+           to keep each track's full json as track.raw. Raises
+           IncompleteListing if the playlist can't be downloaded completely.
+        """
+        return Track.from_items(self.iter_playlist_tracks(playlist_id), keep)
 
     def add_track(self, playlist_id, uri):
         """add track to specified playlist"""
-        endpoint = endpoints['manage_tracks'].format(playlist_id)
+        endpoint = endpoints()['manage_tracks'].format(playlist_id)
         header = {**self.authorized, 'content-type': 'application/json'}
-        return self.post(endpoint, headers=header, params={"uris": [uri]})
+        response = self.post(endpoint, headers=header, params={"uris": [uri]})
+        return self.record_snapshot(playlist_id, response)
 
     def delete_track(self, playlist_id, uri):
         """delete track from specified playlist"""
-        endpoint = endpoints['manage_tracks'].format(playlist_id)
+        endpoint = endpoints()['manage_tracks'].format(playlist_id)
+        header = {**self.authorized, 'accept': 'application/json', 'content-type': 'application/json'}
+        response = self.delete(endpoint, headers=header, data={"tracks": [{"uri": uri}]})
+        return self.record_snapshot(playlist_id, response)
+
+    def add_tracks(self, playlist_id, uris, cache=None):
+        """add any number of tracks to a playlist, 100 uris per request.
+
+           Duplicate uris are dropped and, if a membership cache is given,
+           so are tracks it already lists for the playlist. Chunks are sent
+           in order so the tracks keep their relative order in the playlist.
+
+           ARGUMENTS:
+                playlist_id: str: id of the playlist to modify
+                uris:   iterable: track uris to add
+                cache: MembershipCache: optional, consulted to skip tracks
+                                   already present and updated afterwards.
+
+           returns a dict with the snapshot_id left by the last successful
+           request and the uris and response of every chunk. A failed chunk
+           has a response of None.
+
+           USAGE:
+                result = client.add_tracks(playlist_id, uris, cache=cache)
+                failed = [chunk['uris'] for chunk in result['chunks'] if not chunk['response']]
+        """
+        uris = unique(uris)
+        if cache is not None:
+            uris = [uri for uri in uris if not cache.contains(playlist_id, uri)]
+
+        endpoint = endpoints()['manage_tracks'].format(playlist_id)
+        header = {**self.authorized, 'content-type': 'application/json'}
+
+        def send(chunk):
+            return self.post(endpoint, headers=header, json={"uris": chunk})
+
+        return self.batch_tracks(playlist_id, uris, cache, 'add', send)
+
+    def delete_tracks(self, playlist_id, uris, cache=None):
+        """delete any number of tracks from a playlist, 100 uris per request.
+
+           Works like add_tracks. With a cache that holds the playlist,
+           tracks it doesn't list are skipped.
+        """
+        uris = unique(uris)
+        if cache is not None and cache.has_playlist(playlist_id):
+            uris = [uri for uri in uris if cache.contains(playlist_id, uri)]
+
+        endpoint = endpoints()['manage_tracks'].format(playlist_id)
         header = {**self.authorized, 'accept': 'application/json', 'content-type': 'application/json'}
-        return self.delete(endpoint, headers=header, data={"tracks": [{"uri": uri}]})
+
+        def send(chunk):
+            tracks = [{"uri": uri} for uri in chunk]
+            return self.delete(endpoint, headers=header, json={"tracks": tracks})
+
+        return self.batch_tracks(playlist_id, uris, cache, 'remove', send)
+
+    def batch_tracks(self, playlist_id, uris, cache, update, send):
+        """send uris in TRACK_LIMIT sized chunks, see add_tracks"""
+        result = {'snapshot_id': None, 'chunks': []}
+        for chunk in chunked(uris, TRACK_LIMIT):
+            response = self.record_snapshot(playlist_id, send(chunk))
+            result['chunks'].append({'uris': chunk, 'response': response})
+            if response:
+                result['snapshot_id'] = response['snapshot_id']
+                if cache is not None:
+                    getattr(cache, update)(playlist_id, chunk, response['snapshot_id'])
+        return result
+
+    def add_tracks_bulk(self, batches, workers=4):
+        """add tracks to several playlists in parallel.
+
+           ARGUMENTS:
+                batches: dict: maps each playlist id to an iterable of uris
+                workers:  int: number of playlists modified at the same time
+
+           returns a dict mapping each playlist id to its add_tracks result.
+           The membership cache isn't used here because a sqlite connection
+           can't be shared between threads.
+        """
+        return self.bulk(self.add_tracks, batches, workers)
+
+    def delete_tracks_bulk(self, batches, workers=4):
+        """delete tracks from several playlists in parallel, see add_tracks_bulk"""
+        return self.bulk(self.delete_tracks, batches, workers)
+
+    def bulk(self, method, batches, workers):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pid: pool.submit(method, pid, uris) for pid, uris in batches.items()}
+            return {pid: future.result() for pid, future in futures.items()}
+
+    def record_snapshot(self, playlist_id, response):
+        """remember the snapshot_id returned by a playlist modification"""
+        if response and 'snapshot_id' in response:
+            self.snapshots[playlist_id] = response['snapshot_id']
+            self.invalidate(playlist_id, response['snapshot_id'])
+        return response
 
     def get_track_duration(self, jsdata):
         """calculate the time remaining of currently playing track 
@@ -280,6 +814,4 @@ class SpotifyClient():
           ARGUMENTS:
                 jsdata: json: the json object returned by get_playback()
         """
-        duration = next(fetch(jsdata, 'duration_ms'))
-        position = next(fetch(jsdata, 'progress_ms'))
-        return duration - position
+        return track_length(jsdata) - track_progress(jsdata)
@@ -0,0 +1,100 @@
+"""unix socket protocol letting a resident process answer spotapi commands
+
+Requests and replies are single lines of json:
+
+    -> {"command": "-i"}
+    <- {"ok": true, "output": "Track:  ..."}
+
+A failed command replies {"ok": false, "error": "..."}.
+"""
+import os
+import json
+import socket
+import threading
+import socketserver
+
+SOCKET = os.environ.get('spotapi_socket', '/tmp/spotify-api/spotapi.sock')
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+            output = self.server.commands[message['command']]()
+            reply = {'ok': True, 'output': output}
+
+        except Exception as error:
+            reply = {'ok': False, 'error': f'{type(error).__name__}: {error}'}
+
+        self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+
+class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, commands, path=SOCKET):
+        """ Serves spotapi commands from a long running process such as
+            spotstat, which already holds warm connections, a valid token
+            and the current playback state.
+
+            ARGUMENTS:
+                commands: dict: maps command names to functions taking no
+                                arguments and returning the text to print
+                path:      str: location of the unix socket
+
+            USAGE:
+                server = CommandServer({'-i': info}).start()
+                ...
+                server.stop()
+        """
+        self.commands = commands
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        # created owner only from the start: a chmod after binding would
+        # leave a window where other local users could connect and send -l
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, CommandHandler)
+        finally:
+            os.umask(umask)
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(path={self.path}, commands={list(self.commands)})>"
+
+    def start(self):
+        """serve requests from a background thread"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """stop serving and remove the socket"""
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def request(command, path=SOCKET, timeout=10):
+    """ask the resident process to run a command.
+
+       returns the command's output, or None if no process is listening or
+       the command failed there, in which case the caller runs it directly.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(timeout)
+            connection.connect(path)
+            connection.sendall(json.dumps({'command': command}).encode() + b'\n')
+            with connection.makefile('rb') as reply:
+                message = json.loads(reply.readline())
+
+    except (OSError, ValueError):
+        return None
+
+    return message['output'] if message.get('ok') else None
@@ -0,0 +1,209 @@
+"""append-only binary log of the tracks spotstat has seen played
+"""
+import os
+import mmap
+import time
+import struct
+from bisect import bisect_left
+from collections import Counter
+
+HISTORY_DIRECTORY = os.environ.get('spotify_history', '/tmp/spotify-api/history')
+
+# started, track, artist, duration_ms, played_ms; track and artist are
+# indexes into the string table
+RECORD = struct.Struct('=5I')
+FIELDS = 5
+STARTED, TRACK, ARTIST, DURATION, PLAYED = range(FIELDS)
+
+# plays shorter than this are skips and don't count towards the top lists
+MIN_PLAYED = 30000
+
+
+class History():
+
+    def __init__(self, directory=HISTORY_DIRECTORY):
+        """ Listening history stored as fixed width records.
+
+            Every play is one 20 byte record in plays.log. Track and artist
+            uris are interned: each is written once, with its name, to
+            strings.tsv and records refer to it by line number. The log is
+            only ever appended to in time order, so a time range is found by
+            bisecting the start times, and queries read the mmapped file
+            through a memoryview instead of decoding anything.
+
+            ARGUMENTS:
+                directory: str: where plays.log and strings.tsv live
+
+            USAGE:
+                with History() as history:
+                    history.append(started, track_uri, 'Karma Police',
+                                   artist_uri, 'Radiohead', 264000, 250000)
+                    history.top_tracks(since=time.time() - 7 * 86400)
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, 'plays.log')
+        self.strings_path = os.path.join(directory, 'strings.tsv')
+        self.strings = []
+        self.names = []
+        self.index = {}
+        self.log = None
+        self.read_strings()
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(directory={self.directory})>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.log_path) // RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def close(self):
+        if self.log is not None:
+            os.close(self.log)
+            self.log = None
+
+    def read_strings(self):
+        """load the string table, picking up entries added by the writer"""
+        try:
+            # only '\n' ends an entry: names may hold any other line break,
+            # and a last line without one is still being written
+            with open(self.strings_path, 'r', encoding='utf-8', newline='') as file:
+                lines = file.read().split('\n')[len(self.strings):-1]
+        except FileNotFoundError:
+            return
+        for line in lines:
+            key, _, name = line.partition('\t')
+            self.index[key] = len(self.strings)
+            self.strings.append(key)
+            self.names.append(name)
+
+    def intern(self, key, name):
+        """line number of key in the string table, adding it if needed"""
+        if key not in self.index:
+            with open(self.strings_path, 'a', encoding='utf-8', newline='') as file:
+                file.write(f"{key}\t{name.replace(chr(9), ' ').replace(chr(10), ' ')}\n")
+            self.index[key] = len(self.strings)
+            self.strings.append(key)
+            self.names.append(name)
+        return self.index[key]
+
+    def append(self, started, track, track_name, artist, artist_name, duration_ms, played_ms):
+        """record one play. Each record is a single O_APPEND write, so
+           readers never see part of one."""
+        if self.log is None:
+            self.log = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        record = RECORD.pack(int(started), self.intern(track, track_name),
+                             self.intern(artist, artist_name), int(duration_ms), int(played_ms))
+        os.write(self.log, record)
+
+    def records(self, since=None, until=None):
+        """memoryview of the uint32 fields of the plays in [since, until)
+
+           The view holds FIELDS values per play; view[TRACK::FIELDS] for
+           example is the track of every play in the range.
+        """
+        try:
+            file = open(self.log_path, 'rb')
+        except FileNotFoundError:
+            return memoryview(b'').cast('I')
+        with file:
+            size = os.fstat(file.fileno()).st_size // RECORD.size * RECORD.size
+            if not size:
+                return memoryview(b'').cast('I')
+            data = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+
+        view = memoryview(data).cast('I')
+        started = view[STARTED::FIELDS]
+        first = bisect_left(started, since) if since is not None else 0
+        last = bisect_left(started, until) if until is not None else len(started)
+        return view[first * FIELDS:last * FIELDS]
+
+    def top(self, field, since=None, until=None, limit=10, min_played=MIN_PLAYED):
+        """most played tracks or artists in a time range as (uri, name, plays)"""
+        view = self.records(since, until)
+        counts = Counter(key for key, played in zip(view[field::FIELDS], view[PLAYED::FIELDS])
+                         if played >= min_played)
+        if any(key >= len(self.strings) for key in counts):
+            self.read_strings()
+        return [(self.strings[key], self.names[key], plays) for key, plays in counts.most_common(limit)]
+
+    def top_tracks(self, since=None, until=None, limit=10, min_played=MIN_PLAYED):
+        return self.top(TRACK, since, until, limit, min_played)
+
+    def top_artists(self, since=None, until=None, limit=10, min_played=MIN_PLAYED):
+        return self.top(ARTIST, since, until, limit, min_played)
+
+    def listened(self, since=None, until=None):
+        """total milliseconds played in a time range"""
+        return sum(self.records(since, until)[PLAYED::FIELDS])
+
+
+class HistoryRecorder():
+
+    def __init__(self, history):
+        """ Turns the player states spotstat observes into plays.
+
+            A play ends when another track starts or playback goes idle.
+            The position reached is the last reported progress plus the time
+            played since that poll, capped at the track's duration, since
+            polls are sparse while a track is playing.
+
+            USAGE:
+                recorder = HistoryRecorder(History())
+                for data, changes in poller:
+                    recorder.observe(data)
+                recorder.finish()
+        """
+        self.history = history
+        self.item = None
+        self.started = None
+        self.progress = 0
+        self.observed = None
+        self.playing = False
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(history={self.history!r})>"
+
+    def observe(self, data, now=None):
+        """update the current play with a player state, data may be empty"""
+        now = time.time() if now is None else now
+        item = data.get('item') if data else None
+        if self.item is not None and (item is None or item['uri'] != self.item['uri']):
+            self.finish(now)
+        if item is None:
+            return
+
+        if self.item is None:
+            self.item = item
+            self.started = now - data['progress_ms'] / 1000
+            self.progress = 0
+            self.playing = False
+        self.progress = max(self.reached(now), data['progress_ms'])
+        self.observed = now
+        self.playing = data['is_playing']
+
+    def reached(self, now):
+        """estimated position of the current track, milliseconds"""
+        if self.item is None:
+            return 0
+        elapsed = (now - self.observed) * 1000 if self.playing else 0
+        return min(self.progress + elapsed, self.item['duration_ms'])
+
+    def finish(self, now=None):
+        """write the current play, if any, to the history"""
+        if self.item is None:
+            return
+        now = time.time() if now is None else now
+        artist = (self.item.get('artists') or [{'uri': '', 'name': ''}])[0]
+        self.history.append(self.started, self.item['uri'], self.item['name'],
+                            artist['uri'], artist['name'], self.item['duration_ms'],
+                            self.reached(now))
+        self.item = None
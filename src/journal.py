@@ -0,0 +1,285 @@
+"""durable queue of playlist changes waiting to be sent to spotify
+"""
+import os
+import time
+import fcntl
+import sqlite3
+import threading
+from contextlib import contextmanager
+from membership import open_cache, refresh_playlist, CACHE_FILE
+
+JOURNAL_FILE = os.environ.get('spotify_journal', '/tmp/spotify-api/journal.db')
+SCHEMA_VERSION = 1
+
+ADD = 'add'
+DELETE = 'delete'
+
+# failed operations are retried after 2, 4, 8... seconds, at most an hour
+# apart, and given up on after MAX_ATTEMPTS
+BACKOFF = 2
+MAX_BACKOFF = 3600
+MAX_ATTEMPTS = 12
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    playlist_id TEXT NOT NULL,
+    uri         TEXT NOT NULL,
+    action      TEXT NOT NULL,
+    created     REAL NOT NULL,
+    due         REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    PRIMARY KEY (playlist_id, uri)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS operations_due ON operations (due);
+"""
+
+
+class Journal():
+
+    def __init__(self, path=JOURNAL_FILE):
+        """ Track additions and deletions recorded locally before they are
+            sent, so a like is never lost to a slow or dropped connection.
+
+            Each (playlist, track) pair holds at most one pending operation:
+            recording the same operation twice keeps one, and recording the
+            opposite one cancels it, since neither needs to reach spotify.
+            While a flush is running the pending one may already be on its
+            way, so the opposite operation replaces it and is sent after it
+            instead. Writes are fully synced to disk before record() returns.
+
+            Flushes hold an exclusive lock on a file next to the database,
+            so processes sharing the journal never send the same operation
+            twice.
+
+            ARGUMENTS:
+                path: str: location of the sqlite database
+
+            USAGE:
+                with Journal() as journal:
+                    journal.record(playlist_id, track_uri, ADD)
+                ...
+                flush(api, journal, cache)
+        """
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=10)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            with self.db:
+                self.db.executescript(SCHEMA)
+                self.db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(path={self.path})>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    @contextmanager
+    def locked(self, blocking=True):
+        """hold the exclusive cross process flush lock. With blocking=False
+           yields False at once, without the lock, if a flush holds it."""
+        with open(self.lock_path, 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def record(self, playlist_id, uri, action):
+        """queue an operation. returns 'queued', 'duplicate' when the same
+           operation is already pending, 'cancelled' when it undid a pending
+           opposite operation, or 'replaced' when the opposite operation may
+           be in flight and this one will be sent after it."""
+        with self.locked(blocking=False) as idle, self.db:
+            row = self.db.execute(
+                'SELECT action FROM operations WHERE playlist_id = ? AND uri = ?',
+                (playlist_id, uri)).fetchone()
+            if row and row[0] == action:
+                return 'duplicate'
+            if row and idle:
+                self.db.execute('DELETE FROM operations WHERE playlist_id = ? AND uri = ?',
+                                (playlist_id, uri))
+                return 'cancelled'
+            now = time.time()
+            if row:
+                # a newer created keeps done() from deleting it for the old one
+                self.db.execute(
+                    'UPDATE operations SET action = ?, created = ?, due = ?, attempts = 0, '
+                    'error = NULL WHERE playlist_id = ? AND uri = ?',
+                    (action, now, now, playlist_id, uri))
+                return 'replaced'
+            self.db.execute(
+                'INSERT INTO operations (playlist_id, uri, action, created, due) '
+                'VALUES (?, ?, ?, ?, ?)', (playlist_id, uri, action, now, now))
+            return 'queued'
+
+    def action(self, playlist_id, uri):
+        """the pending action for a track, or None"""
+        row = self.db.execute('SELECT action FROM operations WHERE playlist_id = ? AND uri = ?',
+                              (playlist_id, uri)).fetchone()
+        return row[0] if row else None
+
+    def due(self, now=None):
+        """pending operations ready to be sent, grouped by playlist:
+           {playlist_id: {'add': [uris], 'delete': [uris]}} in recorded order"""
+        now = time.time() if now is None else now
+        batches = {}
+        for playlist_id, uri, action in self.db.execute(
+                'SELECT playlist_id, uri, action FROM operations WHERE due <= ? '
+                'ORDER BY created', (now,)):
+            batches.setdefault(playlist_id, {ADD: [], DELETE: []})[action].append(uri)
+        return batches
+
+    def next_due(self):
+        """time the earliest pending operation can be sent, or None"""
+        return self.db.execute('SELECT min(due) FROM operations').fetchone()[0]
+
+    def done(self, playlist_id, uris, action, sent):
+        """forget operations sent successfully. Only rows still holding the
+           action recorded before `sent`, the time they were read, are
+           deleted, not ones replaced meanwhile."""
+        with self.db:
+            self.db.executemany(
+                'DELETE FROM operations WHERE playlist_id = ? AND uri = ? '
+                'AND action = ? AND created <= ?',
+                ((playlist_id, uri, action, sent) for uri in uris))
+
+    def failed(self, playlist_id, uris, action, sent, error):
+        """schedule a retry with exponential backoff, or give up for good"""
+        now = time.time()
+        with self.db:
+            for uri in uris:
+                self.db.execute(
+                    'UPDATE operations SET attempts = attempts + 1, error = ?, '
+                    'due = CASE WHEN attempts + 1 >= ? THEN NULL '
+                    'ELSE ? + min(?, ? * (1 << attempts)) END '
+                    'WHERE playlist_id = ? AND uri = ? AND action = ? AND created <= ?',
+                    (error, MAX_ATTEMPTS, now, MAX_BACKOFF, BACKOFF, playlist_id, uri,
+                     action, sent))
+
+    def operations(self):
+        """every queued operation, including the ones given up on (due None)"""
+        columns = ('playlist_id', 'uri', 'action', 'created', 'due', 'attempts', 'error')
+        rows = self.db.execute(f"SELECT {', '.join(columns)} FROM operations ORDER BY created")
+        return [dict(zip(columns, row)) for row in rows]
+
+
+def flush(api, journal, cache=None):
+    """send every due operation, one batched request per playlist and action.
+
+       Before sending, the playlist's membership is brought up to date, so
+       tracks added meanwhile on another device aren't added twice and
+       deletes aren't skipped for tracks the cache doesn't know about yet.
+       If it can't be refreshed the playlist's operations count as failed.
+       The membership cache is updated with each successful request. Failed
+       tracks stay queued for a retry.
+
+       The journal's flush lock is held throughout, so a flush running in
+       another process waits and then finds the operations already sent.
+
+       returns a dict counting the tracks sent and failed.
+    """
+    with journal.locked():
+        return send_due(api, journal, cache)
+
+
+def send_due(api, journal, cache):
+    """flush's work, called with the flush lock held"""
+    counts = {'sent': 0, 'failed': 0}
+    sent = time.time()
+    for playlist_id, batch in journal.due(sent).items():
+        refreshed = cache is None
+        for action, method in ((ADD, api.add_tracks), (DELETE, api.delete_tracks)):
+            uris = batch[action]
+            if not uris:
+                continue
+            try:
+                refreshed = refreshed or refresh_playlist(api, cache, playlist_id)
+                if refreshed:
+                    result = method(playlist_id, uris, cache=cache)
+                    failed = {uri for chunk in result['chunks'] if not chunk['response']
+                              for uri in chunk['uris']}
+                    error = 'request failed'
+                else:
+                    failed, error = set(uris), 'playlist membership could not be refreshed'
+
+            except Exception as exception:
+                failed, error = set(uris), f'{type(exception).__name__}: {exception}'
+
+            journal.done(playlist_id, [uri for uri in uris if uri not in failed], action, sent)
+            if failed:
+                journal.failed(playlist_id, failed, action, sent, error)
+            counts['sent'] += len(uris) - len(failed)
+            counts['failed'] += len(failed)
+    return counts
+
+
+class JournalWorker():
+
+    def __init__(self, api, path=JOURNAL_FILE, cache_path=CACHE_FILE, interval=60):
+        """ Background thread sending the journal's operations with the
+            client of a long running process such as spotstat.
+
+            notify() wakes it up as soon as something is recorded; otherwise
+            it wakes when the next retry is due, and at least every
+            `interval` seconds to pick up operations queued by other
+            processes.
+
+            USAGE:
+                worker = JournalWorker(api).start()
+                ... journal.record(...); worker.notify()
+                worker.stop()
+        """
+        self.api = api
+        self.path = path
+        self.cache_path = cache_path
+        self.interval = interval
+        self.counts = {'sent': 0, 'failed': 0}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run, name='journal', daemon=True)
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(path={self.path}, interval={self.interval})>"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def run(self):
+        # sqlite connections belong to the thread that opened them
+        with Journal(self.path) as journal, open_cache(self.cache_path) as cache:
+            while not self._stopped.is_set():
+                self._wake.clear()
+                try:
+                    for name, count in flush(self.api, journal, cache).items():
+                        self.counts[name] += count
+                except sqlite3.Error as error:
+                    print(f'journal: {error}')
+
+                due = journal.next_due()
+                wait = self.interval if due is None else min(self.interval, max(0, due - time.time()))
+                self._wake.wait(wait)
@@ -0,0 +1,215 @@
+"""local mirror of the user's playlists with offline full text search
+"""
+import os
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+LIBRARY_FILE = os.environ.get('spotify_library', '/tmp/spotify-api/library.db')
+SCHEMA_VERSION = 1
+
+# only the fields the mirror stores are downloaded
+TRACK_FIELDS = 'items(track(uri,name,album(name),artists(name)))'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    playlist_id TEXT PRIMARY KEY,
+    name        TEXT NOT NULL,
+    snapshot_id TEXT,
+    synced      REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tracks (
+    uri     TEXT PRIMARY KEY,
+    name    TEXT NOT NULL,
+    artists TEXT NOT NULL,
+    album   TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS entries (
+    playlist_id TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    uri         TEXT NOT NULL,
+    PRIMARY KEY (playlist_id, position)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS entries_uri ON entries (uri);
+"""
+
+FULL_TEXT = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_text USING fts5(
+    name, artists, album, content='tracks', tokenize='trigram');
+
+CREATE TRIGGER IF NOT EXISTS tracks_insert AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_text (rowid, name, artists, album)
+    VALUES (new.rowid, new.name, new.artists, new.album);
+END;
+
+CREATE TRIGGER IF NOT EXISTS tracks_delete AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_text (tracks_text, rowid, name, artists, album)
+    VALUES ('delete', old.rowid, old.name, old.artists, old.album);
+END;
+"""
+
+
+class Library():
+
+    def __init__(self, path=LIBRARY_FILE):
+        """ Mirror of every playlist and its tracks (name, artists, album and
+            uri) in sqlite, searchable without touching the network.
+
+            sync() only downloads playlists whose snapshot_id changed since
+            the last sync. Searches use an fts5 trigram index, so substring
+            queries of three or more characters are answered from the index;
+            shorter queries, or sqlite builds without fts5 trigram support,
+            fall back to a scan of the tracks table.
+
+            ARGUMENTS:
+                path: str: location of the sqlite database
+
+            USAGE:
+                with Library() as library:
+                    library.sync(api)
+                    for track in library.search('radiohead'):
+                        ...
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=10)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.rebuild()
+        self.full_text = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'tracks_text'").fetchone() is not None
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(path={self.path})>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def rebuild(self):
+        """drop every table and recreate the current schema"""
+        with self.db:
+            for (name, kind) in self.db.execute(
+                    "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'trigger') "
+                    "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'tracks_text_%'").fetchall():
+                self.db.execute(f'DROP {kind.upper()} IF EXISTS {name}')
+            self.db.executescript(SCHEMA)
+            try:
+                self.db.executescript(FULL_TEXT)
+            except sqlite3.OperationalError:
+                pass
+            self.db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+
+    def sync(self, api, workers=4, synced=None):
+        """bring the mirror up to date with the user's playlists.
+
+           ARGUMENTS:
+                api:  SpotifyClient: client used to download playlists
+                workers:        int: playlists downloaded at the same time
+                synced:    callable: optional, called as
+                                     synced(playlist_id, uris, snapshot_id)
+                                     for every playlist downloaded
+
+           returns a dict counting playlists that were updated, unchanged
+           and removed.
+
+           Raises client.IncompleteListing, before anything is removed, when
+           the playlist list or one of the changed playlists couldn't be
+           downloaded in full. Playlists stored before that are kept, a
+           partial playlist never is.
+        """
+        known = dict(self.db.execute('SELECT playlist_id, snapshot_id FROM playlists'))
+        # removals are only decided from a complete list: iter_playlists
+        # raises rather than returning what it got before a failed page
+        current = {item['id']: item for item in api.iter_playlists(cached=False)}
+        changed = [item for pid, item in current.items() if known.get(pid) != item['snapshot_id']]
+        removed = [pid for pid in known if pid not in current]
+
+        def download(item):
+            items = api.iter_playlist_tracks(item['id'], fields=TRACK_FIELDS, cached=False)
+            return item, [entry['track'] for entry in items if entry['track']]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for item, tracks in pool.map(download, changed):
+                self.store(item, tracks)
+                if synced:
+                    synced(item['id'], [track['uri'] for track in tracks], item['snapshot_id'])
+
+        with self.db:
+            for pid in removed:
+                self.db.execute('DELETE FROM entries WHERE playlist_id = ?', (pid,))
+                self.db.execute('DELETE FROM playlists WHERE playlist_id = ?', (pid,))
+            self.prune()
+
+        return {'updated': len(changed), 'unchanged': len(current) - len(changed),
+                'removed': len(removed)}
+
+    def store(self, playlist, tracks):
+        """replace one playlist's entries and add any new tracks"""
+        with self.db:
+            self.db.executemany(
+                'INSERT OR IGNORE INTO tracks (uri, name, artists, album) VALUES (?, ?, ?, ?)',
+                ((track['uri'], track.get('name') or '',
+                  ', '.join(artist['name'] for artist in track.get('artists') or []),
+                  (track.get('album') or {}).get('name') or '') for track in tracks))
+            self.db.execute('DELETE FROM entries WHERE playlist_id = ?', (playlist['id'],))
+            self.db.executemany(
+                'INSERT INTO entries (playlist_id, position, uri) VALUES (?, ?, ?)',
+                ((playlist['id'], position, track['uri']) for position, track in enumerate(tracks)))
+            self.db.execute(
+                'INSERT OR REPLACE INTO playlists (playlist_id, name, snapshot_id, synced) '
+                'VALUES (?, ?, ?, ?)',
+                (playlist['id'], playlist['name'], playlist['snapshot_id'], time.time()))
+
+    def prune(self):
+        """delete tracks no playlist refers to anymore"""
+        self.db.execute('DELETE FROM tracks WHERE uri NOT IN (SELECT uri FROM entries)')
+
+    def search(self, query, prefix=False, limit=50):
+        """tracks whose name, artists or album contain query.
+
+           With prefix=True only tracks where one of those fields starts
+           with the query match. Matching is case insensitive.
+
+           returns a list of dicts with uri, name, artists, album and the
+           names of the playlists holding the track.
+        """
+        if self.full_text and len(query) >= 3:
+            phrase = '"{}"'.format(query.replace('"', '""'))
+            rows = self.db.execute(
+                'SELECT tracks.uri, tracks.name, tracks.artists, tracks.album FROM tracks_text '
+                'JOIN tracks ON tracks.rowid = tracks_text.rowid WHERE tracks_text MATCH ? '
+                'ORDER BY rank', (phrase,))
+        else:
+            pattern = '%{}%'.format(query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+            rows = self.db.execute(
+                "SELECT uri, name, artists, album FROM tracks WHERE name LIKE ?1 ESCAPE '\\' "
+                "OR artists LIKE ?1 ESCAPE '\\' OR album LIKE ?1 ESCAPE '\\'", (pattern,))
+
+        needle = query.casefold()
+        results = []
+        for uri, name, artists, album in rows:
+            if prefix and not any(field.casefold().startswith(needle) for field in (name, artists, album)):
+                continue
+            results.append({'uri': uri, 'name': name, 'artists': artists, 'album': album,
+                            'playlists': self.playlists_of(uri)})
+            if len(results) == limit:
+                break
+        return results
+
+    def playlists_of(self, uri):
+        return [name for (name,) in self.db.execute(
+            'SELECT DISTINCT playlists.name FROM entries JOIN playlists USING (playlist_id) '
+            'WHERE entries.uri = ? ORDER BY playlists.name', (uri,))]
+
+    def stats(self):
+        count = lambda table: self.db.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+        return {'playlists': count('playlists'), 'tracks': count('tracks'), 'entries': count('entries')}
@@ -0,0 +1,162 @@
+"""automatic batching of single item lookups into multi id requests
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class DataLoader():
+
+    def __init__(self, batch, max_batch, window=0.01, max_cached=10000, workers=2):
+        """ Collects keys asked for one at a time, from any number of
+            threads, and fetches them together.
+
+            A batch is sent when it holds max_batch keys, or `window`
+            seconds after its first key arrived, whichever comes first.
+            Keys already pending or in flight are not asked for twice, and
+            values are remembered, least recently used first out, so each
+            key is normally fetched once.
+
+            ARGUMENTS:
+                batch:   callable: batch(keys) returns a dict mapping keys to
+                                   values. Keys missing from the dict get
+                                   None. If it raises, every key of the
+                                   batch fails with its exception.
+                max_batch:    int: most keys per batch, the api's limit
+                window:     float: seconds to wait for more keys
+                max_cached:   int: values remembered, 0 disables
+                workers:      int: batches fetched at the same time
+
+            USAGE:
+                loader = DataLoader(fetch_tracks, 50)
+                future = loader.load(track_id)
+                tracks = loader.load_many(track_ids)
+        """
+        self.batch = batch
+        self.max_batch = max_batch
+        self.window = window
+        self.max_cached = max_cached
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.in_flight = {}
+        self.timer = None
+        self.counts = {'keys': 0, 'cached': 0, 'batches': 0}
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f"<class {type(self).__name__}(max_batch={self.max_batch}, "
+                f"window={self.window}, cached={len(self.cache)})>")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(self, key):
+        """a future for the value of key"""
+        with self._lock:
+            future, batch = self.enqueue(key)
+        if batch:
+            self.executor.submit(self.dispatch, batch)
+        return future
+
+    def load_many(self, keys):
+        """values of every key, in order, waiting for them.
+
+           The caller has all of its keys at once, so they are sent as soon
+           as they are queued instead of waiting out the window.
+        """
+        batches = []
+        with self._lock:
+            futures = []
+            for key in keys:
+                future, batch = self.enqueue(key)
+                futures.append(future)
+                if batch:
+                    batches.append(batch)
+            batches.append(self.take())
+        for batch in batches:
+            if batch:
+                self.executor.submit(self.dispatch, batch)
+        return [future.result() for future in futures]
+
+    def enqueue(self, key):
+        """future for key and a full batch to send, if any. caller holds the lock"""
+        self.counts['keys'] += 1
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.counts['cached'] += 1
+            future = Future()
+            future.set_result(self.cache[key])
+            return future, None
+
+        future = self.pending.get(key) or self.in_flight.get(key)
+        if future is not None:
+            return future, None
+
+        future = self.pending[key] = Future()
+        if len(self.pending) >= self.max_batch:
+            return future, self.take()
+        if self.timer is None:
+            self.timer = threading.Timer(self.window, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+        return future, None
+
+    def take(self):
+        """move the pending keys in flight. caller holds the lock"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, {}
+        self.in_flight.update(batch)
+        return batch
+
+    def flush(self):
+        """send the pending keys now"""
+        with self._lock:
+            batch = self.take()
+        if batch:
+            self.dispatch(batch)
+
+    def dispatch(self, batch):
+        try:
+            values = self.batch(list(batch))
+        except Exception as error:
+            values, failure = {}, error
+        else:
+            failure = None
+
+        with self._lock:
+            self.counts['batches'] += 1
+            for key in batch:
+                del self.in_flight[key]
+                value = values.get(key)
+                if failure is None and value is not None and self.max_cached:
+                    self.cache[key] = value
+                    if len(self.cache) > self.max_cached:
+                        self.cache.popitem(last=False)
+
+        for key, future in batch.items():
+            if failure is not None:
+                future.set_exception(failure)
+            else:
+                future.set_result(values.get(key))
+
+    def clear(self, key=None):
+        """forget one remembered value, or all of them"""
+        with self._lock:
+            if key is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(key, None)
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, 'remembered': len(self.cache)}
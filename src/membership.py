@@ -0,0 +1,178 @@
+"""on-disk index of which tracks belong to which playlists
+"""
+import os
+import time
+import sqlite3
+
+CACHE_FILE = '/tmp/spotify-api/membership.db'
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    playlist_id TEXT PRIMARY KEY,
+    snapshot_id TEXT,
+    updated     REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS tracks (
+    playlist_id TEXT NOT NULL,
+    uri         TEXT NOT NULL,
+    PRIMARY KEY (playlist_id, uri)
+) WITHOUT ROWID;
+"""
+
+
+class MembershipCache():
+
+    def __init__(self, path=CACHE_FILE):
+        """ Index of (playlist_id, track uri) pairs stored in sqlite.
+
+            Lookups are exact matches on the primary key, so asking whether
+            a track is in a playlist reads a handful of pages no matter how
+            large the playlist is, instead of scanning a text file. Any
+            number of playlists can be cached side by side.
+
+            Each playlist's snapshot_id is stored with its tracks. Spotify
+            changes the snapshot_id whenever a playlist is modified, so
+            comparing it with the current one tells whether the cached
+            tracks are still valid.
+
+            The file only holds data that can be downloaded again, so if its
+            schema is out of date it is simply rebuilt.
+
+            ARGUMENTS:
+                path: str: location of the sqlite database
+
+            USAGE:
+                cache = MembershipCache()
+                if cache.snapshot(playlist_id) != current_snapshot_id:
+                    cache.replace(playlist_id, uris, current_snapshot_id)
+                cache.contains(playlist_id, track_uri)
+        """
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=10)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.rebuild()
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(path={self.path})>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def rebuild(self):
+        """drop every table and recreate the current schema"""
+        with self.db:
+            tables = self.db.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            for (table,) in tables.fetchall():
+                self.db.execute(f'DROP TABLE {table}')
+            self.db.executescript(SCHEMA)
+            self.db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+
+    def has_playlist(self, playlist_id):
+        """true if the playlist's tracks have been cached"""
+        query = 'SELECT 1 FROM playlists WHERE playlist_id = ?'
+        return self.db.execute(query, (playlist_id,)).fetchone() is not None
+
+    def snapshot(self, playlist_id):
+        """snapshot_id the cached tracks correspond to, None if unknown"""
+        query = 'SELECT snapshot_id FROM playlists WHERE playlist_id = ?'
+        row = self.db.execute(query, (playlist_id,)).fetchone()
+        return row[0] if row else None
+
+    def contains(self, playlist_id, uri):
+        """exact membership test for a track uri in a cached playlist"""
+        query = 'SELECT 1 FROM tracks WHERE playlist_id = ? AND uri = ?'
+        return self.db.execute(query, (playlist_id, uri)).fetchone() is not None
+
+    def members(self, playlist_id):
+        """set of every cached track uri in the playlist"""
+        query = 'SELECT uri FROM tracks WHERE playlist_id = ?'
+        return {uri for (uri,) in self.db.execute(query, (playlist_id,))}
+
+    def count(self, playlist_id):
+        query = 'SELECT count(*) FROM tracks WHERE playlist_id = ?'
+        return self.db.execute(query, (playlist_id,)).fetchone()[0]
+
+    def replace(self, playlist_id, uris, snapshot_id=None):
+        """cache the complete track list of a playlist, discarding the old one"""
+        with self.db:
+            self.db.execute('DELETE FROM tracks WHERE playlist_id = ?', (playlist_id,))
+            self._insert(playlist_id, uris)
+            self.db.execute(
+                'INSERT OR REPLACE INTO playlists (playlist_id, snapshot_id, updated) '
+                'VALUES (?, ?, ?)', (playlist_id, snapshot_id, time.time()))
+
+    def add(self, playlist_id, uris, snapshot_id=None):
+        """record tracks added to a cached playlist.
+
+           Pass the snapshot_id returned by the add request so the cache
+           stays valid after our own change.
+        """
+        with self.db:
+            self._insert(playlist_id, uris)
+            self._touch(playlist_id, snapshot_id)
+
+    def remove(self, playlist_id, uris, snapshot_id=None):
+        """record tracks removed from a cached playlist"""
+        with self.db:
+            self.db.executemany(
+                'DELETE FROM tracks WHERE playlist_id = ? AND uri = ?',
+                ((playlist_id, uri) for uri in uris))
+            self._touch(playlist_id, snapshot_id)
+
+    def forget(self, playlist_id):
+        """drop a playlist from the cache so it is downloaded again"""
+        with self.db:
+            self.db.execute('DELETE FROM tracks WHERE playlist_id = ?', (playlist_id,))
+            self.db.execute('DELETE FROM playlists WHERE playlist_id = ?', (playlist_id,))
+
+    def _insert(self, playlist_id, uris):
+        self.db.executemany(
+            'INSERT OR IGNORE INTO tracks (playlist_id, uri) VALUES (?, ?)',
+            ((playlist_id, uri) for uri in uris))
+
+    def _touch(self, playlist_id, snapshot_id=None):
+        self.db.execute(
+            'UPDATE playlists SET updated = ?, snapshot_id = coalesce(?, snapshot_id) '
+            'WHERE playlist_id = ?', (time.time(), snapshot_id, playlist_id))
+
+
+def refresh_playlist(api, cache, playlist_id):
+    """make sure the cached tracks of a playlist are current.
+
+       The cached tracks are trusted only while the playlist's snapshot_id
+       matches the one recorded with them, otherwise they are refetched.
+       If the snapshot_id can't be retrieved the cache is used as is.
+
+       The cache is only replaced after the whole playlist downloaded. If a
+       page fails the old entry is left alone and False is returned, True
+       means the cache can be trusted.
+    """
+    from client import IncompleteListing
+
+    current = api.get_snapshot_id(playlist_id)
+    if cache.has_playlist(playlist_id) and (not current or current == cache.snapshot(playlist_id)):
+        return True
+    try:
+        items = api.iter_playlist_tracks(playlist_id, fields='items(track(uri))')
+        uris = [item['track']['uri'] for item in items if item['track']]
+
+    except IncompleteListing as error:
+        print(error)
+        return False
+    cache.replace(playlist_id, uris, current)
+    return True
+
+
+def open_cache(path=CACHE_FILE):
+    """open the membership cache, creating its directory if needed"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return MembershipCache(path)
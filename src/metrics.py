@@ -0,0 +1,216 @@
+"""request metrics collected through SpotifyClient hooks
+"""
+import os
+import json
+import time
+import glob
+import tempfile
+import threading
+
+METRICS_DIRECTORY = '/tmp/spotify-api'
+
+# histogram bucket upper bounds in milliseconds
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+
+class Histogram():
+
+    def __init__(self, buckets=BUCKETS):
+        """fixed bucket latency histogram, values in milliseconds"""
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """upper bound of the bucket holding the q quantile"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return 0
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': round(self.total, 3), 'counts': list(self.counts)}
+
+    def merge(self, data):
+        self.count += data['count']
+        self.total += data['sum']
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, data['counts'])]
+
+
+class Metrics():
+
+    def __init__(self, transport=None):
+        """ Request hook collecting per endpoint latency histograms, bytes
+            received, and error, retry and token refresh counters.
+
+            Register it with a client to start collecting:
+
+                metrics = Metrics(api.transport)
+                api.hooks.append(metrics)
+                ...
+                metrics.dump('/tmp/spotify-api/metrics-spotstat.json')
+
+            The client only times requests and builds events when it has
+            hooks, so leaving metrics off costs a few local assignments per
+            request.
+
+            ARGUMENTS:
+                transport: ConnectionPool: optional. If given, the number of
+                           connections opened per host is exported too, which
+                           shows how many requests paid for a tcp/tls
+                           handshake.
+        """
+        self.transport = transport
+        self.started = time.time()
+        self.endpoints = {}
+        self.counters = {'requests': 0, 'errors': 0, 'retries': 0, 'refreshes': 0,
+                         'token_rejections': 0, 'bytes': 0}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(requests={self.counters['requests']})>"
+
+    def __call__(self, event):
+        """hook entry point, receives the events emitted by SpotifyClient"""
+        with self._lock:
+            if event['kind'] == 'refresh':
+                self.counters['refreshes'] += 1
+                return
+
+            endpoint = self.endpoints.setdefault(event['endpoint'], {
+                'latency': Histogram(), 'requests': 0, 'errors': 0, 'retries': 0, 'bytes': 0,
+                'statuses': {}})
+            retries = max(0, event['attempts'] - 1 - event['refreshed'])
+            status = str(event['status'])
+
+            endpoint['latency'].observe(event['seconds'] * 1000)
+            endpoint['requests'] += 1
+            endpoint['retries'] += retries
+            endpoint['bytes'] += event['bytes']
+            endpoint['statuses'][status] = endpoint['statuses'].get(status, 0) + 1
+            self.counters['requests'] += 1
+            self.counters['retries'] += retries
+            self.counters['bytes'] += event['bytes']
+            self.counters['token_rejections'] += event['refreshed']
+            if event['error']:
+                endpoint['errors'] += 1
+                self.counters['errors'] += 1
+
+    def to_dict(self):
+        with self._lock:
+            data = {
+                'started': self.started,
+                'updated': time.time(),
+                'counters': dict(self.counters),
+                'endpoints': {name: {**values, 'statuses': dict(values['statuses']),
+                                     'latency': values['latency'].to_dict()}
+                              for name, values in self.endpoints.items()}}
+        if self.transport is not None:
+            data['connections'] = self.transport.connection_stats()
+        return data
+
+    def merge(self, data):
+        """add counts from an earlier dump, see dump(merge=True)"""
+        with self._lock:
+            self.started = min(self.started, data['started'])
+            for name, value in data['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, values in data['endpoints'].items():
+                endpoint = self.endpoints.setdefault(name, {
+                    'latency': Histogram(), 'requests': 0, 'errors': 0, 'retries': 0,
+                    'bytes': 0, 'statuses': {}})
+                endpoint['latency'].merge(values['latency'])
+                for key in ('requests', 'errors', 'retries', 'bytes'):
+                    endpoint[key] += values[key]
+                for status, count in values['statuses'].items():
+                    endpoint['statuses'][status] = endpoint['statuses'].get(status, 0) + count
+
+    def dump(self, path, merge=False):
+        """atomically write the metrics as json.
+
+           With merge=True the counts already in the file are added first,
+           so short lived processes can accumulate into one file.
+        """
+        if merge:
+            try:
+                with open(path, 'r') as file:
+                    self.merge(json.load(file))
+            except (OSError, ValueError, KeyError):
+                pass
+        atomic_write(path, json.dumps(self.to_dict()))
+
+    def to_prometheus(self):
+        """the metrics in prometheus text exposition format"""
+        data = self.to_dict()
+        lines = []
+        for name, value in data['counters'].items():
+            metric = f'spotify_client_{name}_total'
+            lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+
+        lines.append('# TYPE spotify_client_request_duration_ms histogram')
+        for endpoint, values in data['endpoints'].items():
+            latency, cumulative = values['latency'], 0
+            for bound, count in zip(BUCKETS, latency['counts']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else bound
+                lines.append(f'spotify_client_request_duration_ms_bucket'
+                             f'{{endpoint="{endpoint}",le="{le}"}} {cumulative}')
+            lines.append(f'spotify_client_request_duration_ms_sum{{endpoint="{endpoint}"}} {latency["sum"]}')
+            lines.append(f'spotify_client_request_duration_ms_count{{endpoint="{endpoint}"}} {latency["count"]}')
+
+        for host, values in data.get('connections', {}).items():
+            lines.append(f'spotify_client_connections_opened{{host="{host}"}} {values["connections"]}')
+        return '\n'.join(lines) + '\n'
+
+    def dump_prometheus(self, path):
+        """write a prometheus textfile collector file"""
+        atomic_write(path, self.to_prometheus())
+
+
+def atomic_write(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    with os.fdopen(descriptor, 'w') as file:
+        file.write(text)
+    os.replace(temporary, path)
+
+
+def metrics_file(process):
+    return os.path.join(METRICS_DIRECTORY, f'metrics-{process}.json')
+
+
+def report(directory=METRICS_DIRECTORY):
+    """table of the metrics dumped by every process, for spotapi -s"""
+    lines = []
+    for path in sorted(glob.glob(os.path.join(directory, 'metrics-*.json'))):
+        with open(path, 'r') as file:
+            data = json.load(file)
+
+        process = os.path.basename(path)[len('metrics-'):-len('.json')]
+        counters = ', '.join(f'{name} {value}' for name, value in data['counters'].items())
+        lines.append(f"{process}: {counters}")
+        lines.append("  %-16s %8s %7s %7s %9s %9s %9s %10s" % (
+            'endpoint', 'requests', 'errors', 'retries', 'mean ms', 'p50 ms', 'p95 ms', 'bytes'))
+        for name, values in sorted(data['endpoints'].items()):
+            latency = Histogram()
+            latency.merge(values['latency'])
+            mean = latency.total / latency.count if latency.count else 0
+            lines.append("  %-16s %8d %7d %7d %9.1f %9s %9s %10d" % (
+                name, values['requests'], values['errors'], values['retries'], mean,
+                latency.quantile(0.5), latency.quantile(0.95), values['bytes']))
+        for host, values in data.get('connections', {}).items():
+            lines.append(f"  {host}: {values['connections']} connections for {values['requests']} requests")
+        lines.append('')
+    return '\n'.join(lines) if lines else 'no metrics recorded\n'
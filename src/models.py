@@ -0,0 +1,197 @@
+"""compact objects for the tracks, playlists and player states the api returns
+"""
+import sys
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    """decode a json response body, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def intern(text):
+    """share one copy of ids, uris and names repeated across a response"""
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+def artist_fields(data):
+    """the fields Artist is built from, without building it yet"""
+    return (intern(data.get('id')), intern(data.get('uri')), intern(data.get('name')))
+
+
+class Model():
+    """ Base of the api models. Each model copies the handful of fields it
+        is built for into __slots__ and drops the rest of the response, so
+        the nested images, markets and urls dicts of a large playlist can be
+        freed. Nested models are kept as tuples of their fields until they
+        are first used. Pass keep=True to from_json to hold on to the
+        original dict as model.raw as well.
+    """
+    __slots__ = ('raw',)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.shown)
+        return f"<class {type(self).__name__}({fields})>"
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.uri == self.uri
+
+    def __hash__(self):
+        return hash(self.uri)
+
+
+class Artist(Model):
+    __slots__ = ('id', 'uri', 'name')
+    shown = ('name', 'uri')
+
+    def __init__(self, id, uri, name, raw=None):
+        self.id = intern(id)
+        self.uri = intern(uri)
+        self.name = intern(name)
+        self.raw = raw
+
+    @classmethod
+    def from_json(cls, data, keep=False):
+        return cls(data.get('id'), data.get('uri'), data.get('name'), data if keep else None)
+
+
+class Album(Model):
+    __slots__ = ('id', 'uri', 'name', 'release_date', '_artists')
+    shown = ('name', 'uri')
+
+    def __init__(self, id, uri, name, release_date=None, artists=(), raw=None):
+        self.id = intern(id)
+        self.uri = intern(uri)
+        self.name = intern(name)
+        self.release_date = intern(release_date)
+        self._artists = artists
+        self.raw = raw
+
+    @classmethod
+    def from_json(cls, data, keep=False):
+        artists = tuple(artist_fields(artist) for artist in data.get('artists') or ())
+        return cls(data.get('id'), data.get('uri'), data.get('name'), data.get('release_date'),
+                   artists, data if keep else None)
+
+    @property
+    def artists(self):
+        if self._artists and isinstance(self._artists[0], tuple):
+            self._artists = tuple(Artist(*fields) for fields in self._artists)
+        return self._artists
+
+
+class Track(Model):
+    __slots__ = ('id', 'uri', 'name', 'duration_ms', 'explicit', 'is_local', '_album', '_artists')
+    shown = ('name', 'uri')
+
+    def __init__(self, id, uri, name, duration_ms=0, explicit=False, is_local=False,
+                 album=None, artists=(), raw=None):
+        self.id = intern(id)
+        self.uri = intern(uri)
+        self.name = name
+        self.duration_ms = duration_ms
+        self.explicit = explicit
+        self.is_local = is_local
+        self._album = album
+        self._artists = artists
+        self.raw = raw
+
+    @classmethod
+    def from_json(cls, data, keep=False):
+        album = data.get('album')
+        if album:
+            album = (album.get('id'), album.get('uri'), album.get('name'), album.get('release_date'),
+                     tuple(artist_fields(artist) for artist in album.get('artists') or ()))
+        artists = tuple(artist_fields(artist) for artist in data.get('artists') or ())
+        return cls(data.get('id'), data.get('uri'), data.get('name'), data.get('duration_ms', 0),
+                   data.get('explicit', False), data.get('is_local', False), album, artists,
+                   data if keep else None)
+
+    @classmethod
+    def from_items(cls, items, keep=False):
+        """tracks of playlist track page items, skipping removed tracks"""
+        return [cls.from_json(item['track'], keep) for item in items if item.get('track')]
+
+    @property
+    def album(self):
+        if isinstance(self._album, tuple):
+            self._album = Album(*self._album)
+        return self._album
+
+    @property
+    def artists(self):
+        if self._artists and isinstance(self._artists[0], tuple):
+            self._artists = tuple(Artist(*fields) for fields in self._artists)
+        return self._artists
+
+    @property
+    def artist(self):
+        """the first, main artist of the track"""
+        return self.artists[0] if self._artists else None
+
+
+class Playlist(Model):
+    __slots__ = ('id', 'uri', 'name', 'snapshot_id', 'owner', 'total', 'tracks')
+    shown = ('name', 'uri', 'total')
+
+    def __init__(self, id, uri, name, snapshot_id=None, owner=None, total=0, tracks=None, raw=None):
+        self.id = intern(id)
+        self.uri = intern(uri)
+        self.name = name
+        self.snapshot_id = snapshot_id
+        self.owner = intern(owner)
+        self.total = total
+        self.tracks = tracks
+        self.raw = raw
+
+    @classmethod
+    def from_json(cls, data, keep=False):
+        """a playlist from the playlists list or a full playlist object.
+           Track pages included in a full playlist become Track objects."""
+        page = data.get('tracks') or {}
+        tracks = Track.from_items(page['items'], keep) if 'items' in page else None
+        return cls(data.get('id'), data.get('uri'), data.get('name'), data.get('snapshot_id'),
+                   (data.get('owner') or {}).get('id'), page.get('total', 0), tracks,
+                   data if keep else None)
+
+
+class PlaybackState(Model):
+    __slots__ = ('is_playing', 'progress_ms', 'timestamp', 'device', 'context', 'item')
+    shown = ('is_playing', 'progress_ms', 'item')
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __init__(self, is_playing, progress_ms, timestamp=None, device=None, context=None,
+                 item=None, raw=None):
+        self.is_playing = is_playing
+        self.progress_ms = progress_ms
+        self.timestamp = timestamp
+        self.device = device
+        self.context = intern(context)
+        self.item = item
+        self.raw = raw
+
+    @classmethod
+    def from_json(cls, data, keep=False):
+        """player state, None when nothing is playing (an empty response)"""
+        if not data:
+            return None
+        item = data.get('item')
+        return cls(data.get('is_playing', False), data.get('progress_ms') or 0, data.get('timestamp'),
+                   (data.get('device') or {}).get('name'), (data.get('context') or {}).get('uri'),
+                   Track.from_json(item, keep) if item else None, data if keep else None)
+
+    @property
+    def uri(self):
+        return self.item.uri if self.item else None
+
+    @property
+    def remaining_ms(self):
+        return max(0, self.item.duration_ms - self.progress_ms) if self.item else 0
@@ -0,0 +1,185 @@
+"""
+Watch the playback state of many spotify accounts from a single process.
+
+Every account gets its own SpotifyClient, with its own shared token file and
+rate limiter, while all of them send requests over one keep-alive connection
+pool. Accounts are polled adaptively by a bounded pool of worker threads,
+and each change is published per account.
+
+The accounts file is a json list:
+
+    [{"name": "alice", "client": "...", "secret": "...", "refresh_token": "..."},
+     {"name": "bob", ...}]
+
+USAGE:
+    python monitor.py accounts.json
+    python monitor.py accounts.json --workers 32 --output /tmp/spotify-api/accounts
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from client import SpotifyClient
+from poller import PlaybackPoller
+from transport import ConnectionPool
+from sinks import StatusOutput, StatusTemplate, JsonSink
+
+OUTPUT_DIRECTORY = '/tmp/spotify-api/accounts'
+TEMPLATE = '{artist} - {track}'
+
+
+class Account():
+
+    def __init__(self, name, api, poller):
+        self.name = name
+        self.api = api
+        self.poller = poller
+        self.authorized = False
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(name={self.name})>"
+
+
+class PlaybackMonitor():
+
+    def __init__(self, accounts, publish, workers=16, min_interval=1, max_interval=30,
+                 token_directory=OUTPUT_DIRECTORY):
+        """ Polls the player of every account and calls publish whenever one
+            of them changes.
+
+            Each account is polled on its own adaptive schedule (see
+            PlaybackPoller). A heap holds the time each account is next due,
+            and at most `workers` polls run at once, so hundreds of mostly
+            idle accounts cost a handful of threads and connections.
+
+            ARGUMENTS:
+                accounts:   list: dicts with name, client, secret,
+                                  refresh_token and optionally redirect
+                publish: callable: publish(name, data, changes), called from
+                                   worker threads
+                workers:     int: concurrent polls, also the api pool size
+                min_interval, max_interval: see PlaybackPoller
+                token_directory: str: where each account's token file lives
+        """
+        self.publish = publish
+        self.workers = workers
+        self.transport = ConnectionPool({'api.spotify.com': workers, 'accounts.spotify.com': 4})
+        self.stopped = threading.Event()
+        self.accounts = []
+        os.makedirs(token_directory, exist_ok=True)
+        for settings in accounts:
+            api = SpotifyClient(
+                client=settings['client'], secret=settings['secret'],
+                redirect=settings.get('redirect'), transport=self.transport,
+                token_file=os.path.join(token_directory, f"{settings['name']}.auth.json"))
+            api.refresh = settings['refresh_token']
+            poller = PlaybackPoller(api, min_interval=min_interval, max_interval=max_interval)
+            self.accounts.append(Account(settings['name'], api, poller))
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(accounts={len(self.accounts)}, workers={self.workers})>"
+
+    @classmethod
+    def from_file(cls, path, publish, **kwargs):
+        with open(path, 'r') as file:
+            return cls(json.load(file), publish, **kwargs)
+
+    def poll(self, account):
+        """poll one account, returns the seconds until it is due again"""
+        try:
+            if not account.authorized:
+                account.authorized = bool(account.api.load_access())
+                if not account.authorized:
+                    return account.poller.max_interval
+
+            data, changes, interval = account.poller.poll()
+            if changes:
+                self.publish(account.name, data, changes)
+            return interval
+
+        except Exception as error:
+            print(f'{account.name}: {type(error).__name__}: {error}')
+            return account.poller.max_interval
+
+    def run(self):
+        """poll every account until stop() is called"""
+        due = [(time.monotonic(), index) for index in range(len(self.accounts))]
+        heapq.heapify(due)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while not self.stopped.is_set():
+                now = time.monotonic()
+                while due and due[0][0] <= now and len(running) < self.workers:
+                    _, index = heapq.heappop(due)
+                    running[pool.submit(self.poll, self.accounts[index])] = index
+
+                timeout = max(0.0, due[0][0] - now) if due else None
+                if not running:
+                    self.stopped.wait(timeout)
+                    continue
+
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    heapq.heappush(due, (time.monotonic() + future.result(), index))
+
+    def stop(self):
+        self.stopped.set()
+
+    def close(self):
+        self.transport.close()
+
+    def stats(self):
+        """per account request counts, see PlaybackPoller.stats"""
+        return {account.name: account.poller.stats() for account in self.accounts}
+
+
+def json_publisher(directory=OUTPUT_DIRECTORY, template=TEMPLATE):
+    """publish function writing each account's status to <directory>/<name>.json"""
+    os.makedirs(directory, exist_ok=True)
+    outputs = {}
+    lock = threading.Lock()
+
+    def publish(name, data, changes):
+        with lock:
+            if name not in outputs:
+                sink = JsonSink(os.path.join(directory, f'{name}.json'))
+                outputs[name] = StatusOutput(StatusTemplate(template), [sink])
+            output = outputs[name]
+        if data and data['is_playing']:
+            output.publish(data)
+        else:
+            output.message('')
+
+    return publish
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('accounts', help='json file listing the accounts')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--min-interval', type=float, default=1)
+    parser.add_argument('--max-interval', type=float, default=30)
+    parser.add_argument('--output', default=OUTPUT_DIRECTORY)
+    args = parser.parse_args()
+
+    monitor = PlaybackMonitor.from_file(
+        args.accounts, json_publisher(args.output), workers=args.workers,
+        min_interval=args.min_interval, max_interval=args.max_interval,
+        token_directory=args.output)
+    try:
+        monitor.run()
+
+    except KeyboardInterrupt:
+        monitor.stop()
+        json.dump(monitor.stats(), sys.stdout, indent=2)
+    finally:
+        monitor.close()
+
+
+if __name__ == '__main__':
+    main()
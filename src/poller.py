@@ -0,0 +1,148 @@
+"""adaptive polling of the spotify player for long running monitors
+"""
+import time
+
+# kinds of change reported by PlaybackPoller.poll
+TRACK = 'track'
+SEEK = 'seek'
+PAUSED = 'paused'
+RESUMED = 'resumed'
+IDLE = 'idle'
+
+
+class PlaybackPoller():
+
+    def __init__(self, api, min_interval=1, max_interval=30, settle=5, drift=3):
+        """ Watches the user's player with a single player request per tick
+            and decides when the next tick should happen:
+
+                playing   just after the current track is due to end, but
+                          never longer than max_interval, so skips made on
+                          another device are still noticed.
+                changed   within `settle` seconds after any change, since
+                          skips and pauses tend to come in runs.
+                paused or
+                idle      backing off, doubling from min_interval up to
+                          max_interval while nothing changes.
+
+            A seek or skip that keeps the same track is detected when the
+            reported progress differs from the expected progress by more
+            than `drift` seconds.
+
+            ARGUMENTS:
+                api:    SpotifyClient: client used for the player requests
+                min_interval:   float: shortest wait between polls, seconds
+                max_interval:   float: longest wait between polls, seconds
+                settle:         float: longest wait after a change, seconds
+                drift:          float: progress error tolerated, seconds
+
+            USAGE:
+                for data, changes in PlaybackPoller(api):
+                    if TRACK in changes:
+                        ...
+        """
+        self.api = api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.settle = settle
+        self.drift = drift
+        self.backoff = min_interval
+        self.data = None
+        self.polled = None
+        self.started = time.monotonic()
+        self.requests = 0
+        self.events = {TRACK: 0, SEEK: 0, PAUSED: 0, RESUMED: 0, IDLE: 0}
+
+    def __repr__(self):
+        return (f"<class {type(self).__name__}(min_interval={self.min_interval}, "
+                f"max_interval={self.max_interval})>")
+
+    def __iter__(self):
+        """yield (playback data, changes) whenever something changes, sleeping between polls"""
+        while True:
+            data, changes, interval = self.poll()
+            if changes:
+                yield data, changes
+            time.sleep(interval)
+
+    def poll(self):
+        """make one player request. returns (data, changes, seconds until the next poll)"""
+        now = time.monotonic()
+        data = self.api.get_playback_status()
+        self.requests += 1
+
+        if data is None:
+            # the request failed; keep the last state and retry soon
+            return self.data, set(), self.wait(idle=True)
+
+        data = data if data.get('item') else {}
+        changes = self.compare(self.data, data, now)
+        for change in changes:
+            self.events[change] += 1
+
+        self.data, self.polled = data, now
+        if changes:
+            self.backoff = self.min_interval
+
+        if not data or not data['is_playing']:
+            return data, changes, self.wait(idle=True)
+
+        remaining = (data['item']['duration_ms'] - data['progress_ms']) / 1000
+        interval = remaining + self.min_interval / 2
+        if changes:
+            interval = min(interval, self.settle)
+        return data, changes, self.wait(interval)
+
+    def compare(self, previous, data, now):
+        """the set of changes between two playback states"""
+        if not data:
+            return {IDLE} if previous or previous is None else set()
+        if not previous:
+            return {TRACK}
+        if previous['item']['uri'] != data['item']['uri']:
+            return {TRACK}
+
+        if previous['is_playing'] and not data['is_playing']:
+            return {PAUSED}
+        if data['is_playing'] and not previous['is_playing']:
+            return {RESUMED}
+
+        elapsed = (now - self.polled) * 1000 if previous['is_playing'] else 0
+        expected = previous['progress_ms'] + elapsed
+        if abs(data['progress_ms'] - expected) > self.drift * 1000:
+            return {SEEK}
+        return set()
+
+    def current(self, max_age=5):
+        """the last player state while it can be trusted, otherwise None.
+
+           The state is stale once it is more than max_age seconds old, or
+           when the track playing at the last poll should have ended by now.
+        """
+        data, polled = self.data, self.polled
+        if not data or polled is None:
+            return None
+        age = time.monotonic() - polled
+        if age > max_age:
+            return None
+        expected = data['progress_ms'] + (age * 1000 if data['is_playing'] else 0)
+        if expected >= data['item']['duration_ms']:
+            return None
+        return data
+
+    def wait(self, interval=None, idle=False):
+        """clamp the interval, or back off exponentially when idle"""
+        if idle:
+            interval, self.backoff = self.backoff, min(self.backoff * 2, self.max_interval)
+        return max(self.min_interval, min(interval, self.max_interval))
+
+    def stats(self):
+        """request counts compared with polling every min_interval"""
+        elapsed = time.monotonic() - self.started
+        fixed = int(elapsed / self.min_interval) + 1
+        return {
+            'elapsed': round(elapsed, 1),
+            'requests': self.requests,
+            'fixed_interval_requests': fixed,
+            'requests_saved': max(0, fixed - self.requests),
+            'events': dict(self.events)}
@@ -0,0 +1,176 @@
+"""rate limiting and retry policy for requests sent to the spotify api
+"""
+import time
+import random
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from requests import exceptions
+from urllib3.exceptions import NewConnectionError
+
+RETRY_STATUS = {500, 502, 503, 504}
+
+# methods that can be repeated safely when it's unknown whether the api
+# acted on the request
+IDEMPOTENT = {'get', 'head', 'options'}
+
+
+class TokenBucket():
+
+    def __init__(self, rate, capacity):
+        """ Thread safe token bucket. Tokens are added at `rate` per second
+            up to `capacity`; every request takes one, waiting if none are
+            left. pause() stops the bucket from handing out tokens for a
+            while, which is how a 429 from the api throttles every thread.
+
+            ARGUMENTS:
+                rate:     float: sustained requests per second
+                capacity:   int: largest burst allowed after an idle period
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.resume = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(rate={self.rate}, capacity={self.capacity})>"
+
+    def acquire(self):
+        """take a token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.resume and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.resume - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """hand out no tokens for the given number of seconds"""
+        with self._lock:
+            self.resume = max(self.resume, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class RequestScheduler():
+
+    def __init__(self, rate=10, burst=20, retries=4, backoff=0.5, max_backoff=30,
+                 endpoint_limits=None):
+        """ Decides when a request may be sent and whether it is retried.
+
+            Every attempt takes a token from a shared TokenBucket and a slot
+            from its endpoint's concurrency cap. Responses are then handled
+            as follows:
+
+                429                 wait for Retry-After, pausing all requests
+                500, 502, 503, 504  retry after an exponential backoff
+                timeouts and
+                connection errors   retry after an exponential backoff
+
+            Only requests with an idempotent method are retried after a
+            5xx or a timeout, since the api may already have acted on them;
+            adding the same tracks twice would duplicate them. Other methods
+            are retried only when it is certain nothing reached the api: a
+            429, or a connection that could not be opened.
+
+            Backoff doubles with every attempt, from `backoff` seconds up to
+            `max_backoff`, with full jitter so several clients don't retry
+            in lockstep. After `retries` retries the last response is
+            returned, or the last exception raised.
+
+            401 handling lives in SpotifyClient.api_connect, since it needs
+            to refresh the token before retrying.
+
+            ARGUMENTS:
+                rate:          float: sustained requests per second
+                burst:           int: token bucket capacity
+                retries:         int: retries per request after the first try
+                backoff:       float: first backoff delay in seconds
+                max_backoff:   float: longest backoff delay in seconds
+                endpoint_limits dict: maps endpoint names to the maximum
+                                      number of concurrent requests
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limits = {name: threading.BoundedSemaphore(size)
+                       for name, size in (endpoint_limits or {}).items()}
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(bucket={self.bucket}, retries={self.retries})>"
+
+    @contextmanager
+    def slot(self, name):
+        """hold one of the endpoint's concurrent request slots"""
+        limit = self.limits.get(name)
+        if limit is None:
+            yield
+            return
+        with limit:
+            yield
+
+    def delay(self, attempt):
+        """exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def execute(self, send, name=None, method='get'):
+        """call send() under the rate limit and retry policy.
+
+           ARGUMENTS:
+                send:  callable: sends the request and returns the response
+                name:       str: endpoint name used for concurrency caps
+                method:     str: http method of the request, see IDEMPOTENT
+        """
+        idempotent = method.lower() in IDEMPOTENT
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                with self.slot(name):
+                    response = send()
+
+            except (exceptions.Timeout, exceptions.ConnectionError) as error:
+                if attempt == self.retries or not (idempotent or never_sent(error)):
+                    raise
+                time.sleep(self.delay(attempt))
+                continue
+
+            if attempt == self.retries:
+                return response
+
+            if response.status_code == 429:
+                self.bucket.pause(retry_after(response, self.delay(attempt)))
+            elif response.status_code in RETRY_STATUS and idempotent:
+                time.sleep(self.delay(attempt))
+            else:
+                return response
+
+
+def never_sent(error):
+    """true if a requests exception shows the request never reached the api"""
+    if isinstance(error, exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, exceptions.Timeout):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def retry_after(response, default):
+    """seconds to wait according to the Retry-After header"""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return default
@@ -0,0 +1,67 @@
+"""coalescing of identical calls made at the same time by several threads
+"""
+import threading
+
+
+class Call():
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+
+    def __init__(self):
+        """ Runs at most one call per key at a time. Threads asking for a key
+            that is already in flight wait for that call and share its
+            result, or its exception, instead of making their own.
+
+            Only calls that overlap are merged, nothing is remembered once a
+            call returns, so this complements the response cache rather
+            than replacing it. Callers sharing a result share the same
+            object and should not modify it.
+
+            USAGE:
+                flight = SingleFlight()
+                data = flight.do(url, partial(api_connect, 'get', url))
+        """
+        self.calls = {}
+        self.counts = {'calls': 0, 'shared': 0}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(in_flight={len(self.calls)})>"
+
+    def do(self, key, function):
+        """return function(), or the result of the call already running for key"""
+        with self._lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+                self.counts['calls'] += 1
+            else:
+                self.counts['shared'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, 'in_flight': len(self.calls)}
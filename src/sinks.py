@@ -0,0 +1,165 @@
+"""status line rendering and output for spotstat
+"""
+import os
+import sys
+import json
+import time
+import errno
+import string
+import tempfile
+from textwrap import shorten
+from utilities import compile_path
+
+# status line fields and where they are found in the player state
+FIELDS = {
+    'artist': 'item.artists.0.name',
+    'album': 'item.album.name',
+    'track': 'item.name',
+    'uri': 'item.uri',
+}
+
+
+class StatusTemplate():
+
+    def __init__(self, template, width=100, fields=FIELDS):
+        """ Status line format compiled once: the json paths of the fields
+            the template uses are compiled up front, so rendering is a few
+            direct lookups and one str.format call.
+
+            ARGUMENTS:
+                template: str: format string using field names from FIELDS,
+                               e.g. 'ARTIST: {artist} | TRACK: {track}'
+                width:    int: longest status line, longer ones are
+                               shortened with '...'
+        """
+        self.template = template
+        self.width = width
+        self.paths = {name: compile_path(fields[name]) for name in fields}
+        used = {field for _, field, _, _ in string.Formatter().parse(template) if field}
+        self.used = {name: self.paths[name] for name in used}
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(template={self.template!r}, width={self.width})>"
+
+    def values(self, data):
+        return {name: path(data, '') for name, path in self.paths.items()}
+
+    def render(self, data):
+        text = self.template.format_map({name: path(data, '') for name, path in self.used.items()})
+        return shorten(text, width=self.width, placeholder='...')
+
+
+class FileSink():
+
+    def __init__(self, path):
+        """writes the status line to a file by atomic rename, so readers
+           such as tmux never see a partially written or empty file"""
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(path={self.path})>"
+
+    def render(self, text, values):
+        return text
+
+    def write(self, text, values):
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix='.status-')
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(self.render(text, values))
+        os.replace(temporary, self.path)
+
+
+class JsonSink(FileSink):
+    """writes the status fields as json for other status bars"""
+
+    def render(self, text, values):
+        return json.dumps({**values, 'text': text, 'updated': time.time()})
+
+
+class FifoSink():
+
+    def __init__(self, path):
+        """writes each new status line to a named pipe, creating the pipe if
+           needed. Updates are dropped while nothing reads the pipe."""
+        self.path = path
+        if not os.path.exists(path):
+            os.mkfifo(path)
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(path={self.path})>"
+
+    def write(self, text, values):
+        try:
+            descriptor = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as error:
+            if error.errno == errno.ENXIO:
+                return
+            raise
+        try:
+            os.write(descriptor, f'{text}\n'.encode())
+        except BlockingIOError:
+            pass
+        finally:
+            os.close(descriptor)
+
+
+class StreamSink():
+
+    def __init__(self, stream=sys.stdout):
+        """writes each new status line to a stream such as stdout"""
+        self.stream = stream
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(stream={self.stream.name})>"
+
+    def write(self, text, values):
+        self.stream.write(f'{text}\n')
+        self.stream.flush()
+
+
+class StatusOutput():
+
+    def __init__(self, template, sinks):
+        """ Renders the status once per update and hands it to every sink,
+            skipping the update entirely when the rendered text hasn't
+            changed since the last one.
+
+            ARGUMENTS:
+                template StatusTemplate: status line format
+                sinks              list: FileSink, JsonSink, FifoSink or
+                                         StreamSink instances
+
+            USAGE:
+                output = StatusOutput(StatusTemplate('{artist} - {track}'),
+                                      [FileSink(bar), StreamSink()])
+                output.publish(playback_data)
+                output.message('Spotify is not playing')
+        """
+        self.template = template
+        self.sinks = sinks
+        self.last = None
+        self.counts = {'writes': 0, 'unchanged': 0}
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(sinks={self.sinks})>"
+
+    def publish(self, data):
+        """render the player state and write it if it changed"""
+        self.emit(self.template.render(data), self.template.values(data))
+
+    def message(self, text):
+        """write a plain message, such as the idle or reset text"""
+        self.emit(text, {name: '' for name in self.template.paths})
+
+    def emit(self, text, values):
+        if text == self.last:
+            self.counts['unchanged'] += 1
+            return
+        for sink in self.sinks:
+            try:
+                sink.write(text, values)
+            except OSError as error:
+                print(f'{sink!r}: {error}')
+        self.last = text
+        self.counts['writes'] += 1
@@ -6,14 +6,17 @@ spotify api about currently playing tracks, playlists and the ability to
 
 This utility caches authorization and media information locally for faster 
 access.
+
+When spotstat is running, commands are answered by it over a unix socket,
+using its open connections and playback state. Otherwise they run here, and
+the client is only imported once it's certain to be needed.
 """
+import io
 import os
 import sys
 import time
-import json
-from datetime import datetime
-from iter.accessories import fetch
-from client import SpotifyClient
+from functools import partial
+from daemon import request
 
 app = os.environ.get('spotify_app')
 key = os.environ.get('spotify_key')
@@ -22,10 +25,50 @@ tkn = os.environ.get('csrf_token')
 uri = os.environ.get('current_track_uri')
 
 liked_tracks = os.environ.get('default_playlist')
-authorization_file = os.environ.get('spotify_auth_file')
+record_metrics = bool(os.environ.get('spotify_metrics'))
+
+api = None
+notify = None
+
+
+def connect():
+    """create the client used when running commands directly"""
+    global api
+    from client import SpotifyClient, cache_ttls
+    from cache import ResponseCache, CACHE_DIRECTORY
+
+    responses = ResponseCache(cache_ttls(), directory=CACHE_DIRECTORY)
+    api = SpotifyClient(client=app, secret=key, csrf=tkn, redirect=url, cache=responses)
+    api.refresh = os.environ.get('spotify_access')
+    return api
+
+
+def resident_commands(client, playback=lambda: None, wake=None):
+    """commands a resident process serves with its own client.
+
+       ARGUMENTS:
+           client:  SpotifyClient: the resident process's client
+           playback:     callable: returns the latest player state if it is
+                                   still current, so info can be answered
+                                   without a request, or None to fetch it
+           wake:         callable: optional, tells the process's journal
+                                   worker that likes or deletes were queued
+    """
+    global api, notify
+    api = client
+    notify = wake
+
+    def capture(command, **kwargs):
+        out = io.StringIO()
+        command(out=out, **kwargs)
+        return out.getvalue()
 
-api = SpotifyClient(client=app, secret=key, csrf=tkn, redirect=url)
-api.refresh = os.environ.get('spotify_access')
+    return {
+        '-h': partial(capture, show_help),
+        '-i': lambda: capture(info, data=playback()),
+        '-p': partial(capture, playlists),
+        '-l': partial(capture, like),
+        '-u': partial(capture, unlike)}
 
 
 def create_tmp(path):
@@ -41,19 +84,23 @@ def create_tmp(path):
         return 0
 
 
-def get_access():
-    """shared session: import access credentials from uthorization file"""
-    try:
-        if datetime.now().strftime('%H:%M:%S') >= get_auth_expiration():
-            api.refresh_access_token()
-            return 0
-
-        with open(authorization_file, 'r') as cs:
-            return json.load(cs)
-
-    except FileNotFoundError:
-        api.refresh_access_token()
-        return 0
+def detach():
+    """fork a grandchild detached from the terminal, so the command can
+       return while it finishes the work. returns True in the grandchild,
+       which must end with os._exit, and False in the calling process."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    child = os.fork()
+    if child:
+        os.waitpid(child, 0)
+        return False
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for descriptor in (0, 1, 2):
+        os.dup2(devnull, descriptor)
+    return True
 
 
 def save_track_uri(track_uri):
@@ -62,105 +109,244 @@ def save_track_uri(track_uri):
         file.write(track_uri)
 
 
-def get_auth_expiration():
-    with open('/tmp/spotify-api/auth-expiration.txt', 'r') as file:
-        return file.read().strip()
+def current_track_uri():
+    """uri of the track spotstat or spotapi info saw playing last"""
+    try:
+        with open(uri, 'r') as track_data:
+            return track_data.read().strip()
+    except OSError:
+        return ''
+
+
+def queue(action, playlist, out):
+    """record a like or delete in the journal and have it sent.
+
+       Only local state is consulted, so this returns at once. A track is
+       reported as already in, or not in, the playlist only when a pending
+       operation or the membership cache says so. If the playlist isn't
+       cached the operation is queued anyway, and flush decides once the
+       playlist has been refreshed.
+
+       Inside spotstat the journal worker is woken to send it; when running
+       directly main sends it from a detached process, and anything that
+       fails stays queued for spotstat or the next command to retry.
+    """
+    from journal import Journal, ADD
+    from membership import open_cache
+
+    track_uri = current_track_uri()
+    if not track_uri:
+        return print('an error has occured: uri file was corrupt or inaccessible', file=out)
+
+    with open_cache() as cache, Journal() as journal:
+        pending = journal.action(playlist, track_uri)
+        if pending is not None:
+            present = pending == ADD
+        elif cache.has_playlist(playlist):
+            present = cache.contains(playlist, track_uri)
+        else:
+            present = None
+        if present is not None and present == (action == ADD):
+            state = 'already in' if present else 'not in'
+            return print(f"track {track_uri} is {state} playlist {playlist}", file=out)
+
+        outcome = journal.record(playlist, track_uri, action)
+        verb = 'added to' if action == ADD else 'deleted from'
+        if outcome == 'cancelled':
+            undone = 'addition to' if action != ADD else 'deletion from'
+            print(f"{track_uri}: cancelled its queued {undone} playlist: {playlist}", file=out)
+        elif outcome == 'duplicate':
+            print(f"{track_uri} is already queued to be {verb} playlist: {playlist}", file=out)
+        elif outcome == 'replaced':
+            print(f"{track_uri} queued to be {verb} playlist: {playlist}, "
+                  f"once the change being sent now is done", file=out)
+        else:
+            print(f"{track_uri} queued to be {verb} playlist: {playlist}", file=out)
+
+    if notify is not None:
+        notify()
+
+
+def send_queued(out=sys.stdout):
+    """send the journal's due operations with this process's client"""
+    from journal import Journal, flush
+    from membership import open_cache
+
+    with open_cache() as cache, Journal() as journal:
+        counts = flush(api, journal, cache)
+    if counts['failed']:
+        print(f"{counts['failed']} changes could not be sent yet and will be retried", file=out)
+
+
+def like(playlist=liked_tracks, out=sys.stdout):
+    """add currently playing track to specified playlist"""
+    from journal import ADD
 
+    queue(ADD, playlist, out)
 
-def check_cache(filename, track):
-    """checks if data is cached then lazily tests for value membership"""
-    with open(filename, 'r') as cached:
-        return next((True for line in cached if track in line), False)
 
+def unlike(playlist=liked_tracks, out=sys.stdout):
+    """delete currently playing track from specified playlist"""
+    from journal import DELETE
 
-def create_cache(filename, items):
-    """create a cache file if one doesn't already exist"""
-    with open(filename, 'w') as cache:
-        cache.write('\n'.join(items))
+    queue(DELETE, playlist, out)
 
 
-def append_cache(filename, track):
-    """append data to the end of the cache file"""
-    with open(filename, 'a') as cache:
-        cache.write(f'{track}')
+def pending(out=sys.stdout):
+    """likes and deletes not sent to spotify yet"""
+    from journal import Journal
 
+    with Journal() as journal:
+        operations = journal.operations()
+    if not operations:
+        return out.write("nothing queued\n")
+    for operation in operations:
+        when = 'given up' if operation['due'] is None else time.strftime(
+            '%H:%M:%S', time.localtime(operation['due']))
+        out.write("%-7s %-38s %-24s %-9s %s\n" % (
+            operation['action'], operation['uri'], operation['playlist_id'], when,
+            operation['error'] or ''))
 
-def track_in_playlist(track, playlist_id):
-    """check to see if track is already in the specified playlist"""
-    if os.path.isfile('/tmp/spotify-api/liked.txt'):
-        return check_cache('/tmp/spotify-api/liked.txt', track)
 
-    data = api.get_playlist(playlist_id)
-    if data:
-        tracks = [item for item in fetch(data['tracks'], 'uri') if 'track' in item]
-        create_cache('/tmp/spotify-api/liked.txt', tracks)
-        return track in tracks
+def playlists(out=sys.stdout):
+    """prints playlist names and corresponding ids to stdout"""
+    from client import IncompleteListing
 
+    try:
+        for item in api.iter_playlists():
+            out.write("%-30s %-25s\n" % (item['name'], item['id']))
+
+    except IncompleteListing as error:
+        print(f'the playlist list is incomplete: {error}', file=out)
+
+
+def info(data=None, out=sys.stdout):
+    """currently playing track info and uris"""
+    if not data or not data.get('item'):
+        data = api.get_current_track()
+    info = data['item']
+    save_track_uri(info['uri'])
+    out.write("%-60s %-25s\n" % (f"Track:  {info['name']}", info['uri']))
+    out.write("%-60s %-25s\n" % (f"Album:  {info['album']['name']}", info['album']['uri']))
+    out.write("%-60s %-25s\n" % (f"Artist: {info['artists'][0]['name']}", info['artists'][0]['uri']))
 
-def like(playlist=liked_tracks):
-    """add currently playing track to specified playlist"""
-    with open(uri, 'r') as track_data:
-        track_uri = track_data.read().strip()
 
-    if track_uri:
-        if track_in_playlist(track_uri, playlist):
-            print(f"track {track_uri} is already in playlist {playlist}")
-            return None
+def sync(out=sys.stdout):
+    """mirror every playlist into the local library, see library.Library.
 
-        response = api.add_track(playlist, track_uri)
+       Playlists downloaded here also refresh the membership cache used by
+       like, since their full track list and snapshot_id are at hand.
+    """
+    from library import Library
+    from membership import open_cache
+    from client import IncompleteListing
 
+    with Library() as library, open_cache() as cache:
         try:
-            print('snapshot id: ', response['snapshot_id'])
-            print(f"added {track_uri} to playlist: {playlist}")
-            append_cache('/tmp/spotify-api/liked.txt', f'{track_uri}\n')
+            counts = library.sync(api, synced=cache.replace)
+        except IncompleteListing as error:
+            return out.write(f"sync aborted, nothing was removed: {error}\n")
+        totals = library.stats()
+    out.write("synced %(updated)d playlists, %(unchanged)d unchanged, %(removed)d removed\n" % counts)
+    out.write("library: %(playlists)d playlists, %(tracks)d tracks\n" % totals)
 
-        except TypeError:
-            print('Spotify was unable to process this request')
-    else:
-        print('an error has occured: uri file was corrupt or inaccessible')
 
+def search(*query, out=sys.stdout):
+    """search the local library, no network requests are made"""
+    from library import Library, LIBRARY_FILE
 
-def playlists():
-    """prints playlist names and corresponding ids to stdout"""
-    plists = api.get_playlists()
-    for item in plists['items']:
-        sys.stdout.write("%-30s %-25s\n" % (item['name'], item['id']))
+    if not os.path.exists(LIBRARY_FILE):
+        return out.write("the library is empty, run spotapi sync first\n")
+    with Library() as library:
+        for track in library.search(' '.join(query)):
+            out.write("%-40s %-30s %-36s %s\n" % (
+                track['name'][:40], track['artists'][:30], track['uri'], ', '.join(track['playlists'])))
 
 
-def info():
-    """currently playing track info and uris"""
-    info = api.get_current_track()['item']
-    save_track_uri(info['uri'])
-    sys.stdout.write("%-60s %-25s\n" % (f"Track:  {info['name']}", info['uri']))
-    sys.stdout.write("%-60s %-25s\n" % (f"Album:  {info['album']['name']}", info['album']['uri']))
-    sys.stdout.write("%-60s %-25s\n" % (f"Artist: {info['artists'][0]['name']}", info['artists'][0]['uri']))
+def top(kind, days=30, out=sys.stdout):
+    """most played tracks or artists of the last days, from spotstat's history"""
+    from history import History
+
+    with History() as history:
+        since = time.time() - float(days) * 86400
+        rows = history.top_tracks(since) if kind == 'tracks' else history.top_artists(since)
+    if not rows:
+        return out.write(f"no plays recorded in the last {days} days\n")
+    for uri, name, plays in rows:
+        out.write("%5d  %-45s %-25s\n" % (plays, name[:45], uri))
+
+
+def stats(out=sys.stdout):
+    """request metrics recorded by spotstat and spotapi"""
+    from metrics import report
 
+    out.write(report())
 
-def show_help():
-    sys.stdout.write("%-30s %-25s\n" % ("spotapi help", "display this help file"))
-    sys.stdout.write("%-30s %-25s\n" % ("spotapi like", "add song to specified default playlist"))
-    sys.stdout.write("%-30s %-25s\n" % ("spotapi playlists", "show all playlists and playlist_ids"))
-    sys.stdout.write("%-30s %-25s\n" % ("spotapi info", "display currently playing track info and uris"))
 
+def show_help(out=sys.stdout):
+    out.write("%-30s %-25s\n" % ("spotapi help", "display this help file"))
+    out.write("%-30s %-25s\n" % ("spotapi like", "add song to specified default playlist"))
+    out.write("%-30s %-25s\n" % ("spotapi unlike", "delete song from specified default playlist"))
+    out.write("%-30s %-25s\n" % ("spotapi pending", "show likes and deletes not sent yet"))
+    out.write("%-30s %-25s\n" % ("spotapi playlists", "show all playlists and playlist_ids"))
+    out.write("%-30s %-25s\n" % ("spotapi info", "display currently playing track info and uris"))
+    out.write("%-30s %-25s\n" % ("spotapi sync", "mirror all playlists into the local library"))
+    out.write("%-30s %-25s\n" % ("spotapi search <query>", "find tracks in the local library, offline"))
+    out.write("%-30s %-25s\n" % ("spotapi top tracks [days]", "most played tracks recorded by spotstat"))
+    out.write("%-30s %-25s\n" % ("spotapi top artists [days]", "most played artists recorded by spotstat"))
+    out.write("%-30s %-25s\n" % ("spotapi stats", "show request metrics (enable with spotify_metrics=1)"))
 
-def main(flag):
+
+def main(flag, *args):
     """main function"""
-    cmd = dict(zip('-h -i -p -l'.split(), (show_help, info, playlists, like)))
+    cmd = dict(zip('-i -p -l -u -y'.split(), (info, playlists, like, unlike, sync)))
+    if flag == '-s':
+        return stats()
+    if flag == '-q':
+        return pending()
+    if flag == '-f':
+        return search(*args)
+    if flag in ('-t', '-a'):
+        return top('tracks' if flag == '-t' else 'artists', *args)
+    if flag not in cmd:
+        return show_help()
+
+    # sync runs here, it's long and writes the library from this process
+    reply = request(flag) if flag != '-y' else None
+    if reply is not None:
+        return sys.stdout.write(reply)
 
     tmp_directory = create_tmp('/tmp/spotify-api')
     if tmp_directory:
-        session = get_access()
-        if session:
-            api.authorized = session['header']
+        queued = flag in ('-l', '-u')
+        if queued:
+            # recorded before connecting and answered at once, a detached
+            # process sends it so the command doesn't wait on the network
+            cmd[flag]()
+            if not detach():
+                return
+
+        connect()
+        if record_metrics:
+            from metrics import Metrics, metrics_file
+            api.hooks.append(Metrics(api.transport))
+        api.load_access()
 
         try:
-            cmd[flag]()
+            if queued:
+                send_queued()
+            else:
+                cmd[flag]()
 
-        except KeyError:
-            show_help()
+        finally:
+            if record_metrics:
+                api.hooks[-1].dump(metrics_file('spotapi'), merge=True)
+            api.close()
+            if queued:
+                os._exit(0)
 
 
 if __name__ == '__main__':
     start = time.time()
-    main(sys.argv[1])
+    main(*sys.argv[1:])
     print(f"\nfinished in {time.time() - start} seconds")
@@ -2,18 +2,27 @@
 """
 Simple script that uses SpotifyClient to display currently playing 
 spotify music in tmux status bar.
+
+While running, it also answers spotapi commands over a unix socket with its
+warm connections and the playback state it already knows.
 """
 import os
 import sys
+import json
 import signal
-from time import sleep
-from textwrap import shorten
-from client import SpotifyClient
-
-from iter.accessories import fetch
+import spotapi
+from client import SpotifyClient, cache_ttls
+from cache import ResponseCache, CACHE_DIRECTORY
+from daemon import CommandServer
+from poller import PlaybackPoller
+from metrics import Metrics, metrics_file
+from history import History, HistoryRecorder
+from journal import JournalWorker
+from sinks import StatusOutput, StatusTemplate, FileSink, JsonSink, FifoSink, StreamSink
 
 RESET = 'Connecting to Spotify...'
-TAGS = ['ARTIST: ', 'ALBUM: ', 'TRACK: ']
+IDLE = 'Spotify is not playing'
+TEMPLATE = 'ARTIST: {artist} | ALBUM: {album} | TRACK: {track}'
 
 app = os.environ.get('spotify_app')
 key = os.environ.get('spotify_key')
@@ -21,11 +30,25 @@ url = os.environ.get('app_redirect')
 tkn = os.environ.get('csrf_token')
 uri = os.environ.get('current_track_uri')
 bar = os.environ.get('status_bar')
+bar_json = os.environ.get('status_json')
+bar_fifo = os.environ.get('status_fifo')
+bar_stdout = os.environ.get('status_stdout')
+bar_format = os.environ.get('status_format', TEMPLATE)
 
-authorizaton_file = os.environ.get('spotify_auth_file')
+min_poll = float(os.environ.get('spotstat_min_poll', 1))
+max_poll = float(os.environ.get('spotstat_max_poll', 30))
+prometheus = os.environ.get('spotify_metrics_prometheus')
 
-api = SpotifyClient(client=app, secret=key, csrf=tkn, redirect=url)
+responses = ResponseCache(cache_ttls(), directory=CACHE_DIRECTORY)
+api = SpotifyClient(client=app, secret=key, csrf=tkn, redirect=url, cache=responses)
 api.refresh = os.environ.get('spotify_access')
+server = None
+metrics = None
+recorder = None
+worker = None
+if os.environ.get('spotify_metrics'):
+    metrics = Metrics(api.transport)
+    api.hooks.append(metrics)
 
 
 def create_tmp(path):
@@ -43,15 +66,38 @@ def create_tmp(path):
 
 def terminate(signum, frame):
     """graceful shutdown and file cleanup on SIGTERM"""
-    status(bar, RESET)
-    open(authorizaton_file, 'w').close()
+    shutdown()
+
+
+def shutdown():
+    """reset the status bar, invalidate the shared session and exit"""
+    if server:
+        server.stop()
+    if worker:
+        worker.stop()
+    if recorder:
+        record(None)
+    export_metrics()
+    output.message(RESET)
+    api.tokens.write({})
+    api.close()
     sys.exit()
 
 
-def status(file, data):
-    """update the tmux status bar"""
-    with open(file, 'w') as spotstat:
-        spotstat.write(data)
+def status_output():
+    """status line sinks: the tmux status bar file plus any optional json
+       file, fifo or stdout configured in the environment"""
+    sinks = [FileSink(bar)] if bar else []
+    if bar_json:
+        sinks.append(JsonSink(bar_json))
+    if bar_fifo:
+        sinks.append(FifoSink(bar_fifo))
+    if bar_stdout:
+        sinks.append(StreamSink())
+    return StatusOutput(StatusTemplate(bar_format), sinks)
+
+
+output = status_output()
 
 
 def get_track_id(data):
@@ -67,41 +113,52 @@ def get_track_id(data):
             file.write(track_id)
 
 
-def query():
-    """query the api for current playback state, artist, album, track info"""
-    data = api.get_current_track()
-    if data:
-        if data['is_playing']:
-            get_track_id(data)
-            info = list({value: 0 for value in fetch(data, 'name')})
-            text = list(zip(TAGS, info))
-            return ' | '.join([''.join(item) for item in text])
-        print('spotify transport state is currently inactive')
-        sys.exit()
-    return 0
+def status(data):
+    """update the status sinks with artist, album, track info"""
+    if data and data['is_playing']:
+        output.publish(data)
+    else:
+        output.message(IDLE)
+
+
+def record(data):
+    """add finished plays to the listening history for spotapi top"""
+    try:
+        recorder.observe(data)
+    except OSError as error:
+        print(f'history: {error}')
+
+
+def export_metrics():
+    """write the request metrics for spotapi -s and prometheus, if enabled"""
+    if metrics:
+        metrics.dump(metrics_file('spotstat'))
+        if prometheus:
+            metrics.dump_prometheus(prometheus)
 
 
 def main():
+    global server, recorder, worker
     tmp_directory = create_tmp('/tmp/spotify-api')
     if tmp_directory:
-        request = 0
-        api.refresh_access_token()
+        api.load_access()
         signal.signal(signal.SIGTERM, terminate)
+        poller = PlaybackPoller(api, min_interval=min_poll, max_interval=max_poll)
+        recorder = HistoryRecorder(History())
+        worker = JournalWorker(api).start()
+        commands = spotapi.resident_commands(api, poller.current, worker.notify)
+        server = CommandServer(commands).start()
         try:
-            while True:
-                while not request:
-                    request = query()
-
-                status(bar, shorten(request, width=100, placeholder='...'))
-                pos = api.get_playback_status()
-                dur = api.get_track_duration(pos)
-                sleep((dur / 1000.0) + 2)
-                request = 0
+            for data, changes in poller:
+                if data:
+                    get_track_id(data)
+                status(data)
+                record(data)
+                export_metrics()
 
         except KeyboardInterrupt:
-            status(bar, RESET)
-            open(authorization_file, 'w').close()
-            sys.exit()
+            print(json.dumps(poller.stats()))
+            shutdown()
 
 
 if __name__ == '__main__':
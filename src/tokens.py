@@ -0,0 +1,120 @@
+"""access token storage shared by every process using the spotify client
+"""
+import os
+import json
+import time
+import fcntl
+import tempfile
+from contextlib import contextmanager
+
+# refresh tokens this many seconds before spotify says they expire
+MARGIN = 120
+
+
+class TokenManager():
+
+    def __init__(self, path, margin=MARGIN):
+        """ Keeps the access token in a json file that spotstat and every
+            spotapi invocation share:
+
+                {"header": {"Authorization": "Bearer ..."},
+                 "refresh_token": "...",
+                 "expires_at": 1602784523.5}
+
+            expires_at is an absolute unix timestamp, so comparisons work
+            across midnight. A token is considered expired `margin` seconds
+            early, so it is refreshed before requests start failing.
+
+            Reads are cached against the file's stat signature, so checking
+            the token costs a single stat call unless another process wrote
+            a new one. Writes go to a temporary file that is renamed over
+            the old one, so readers never see a partial file. Refreshes are
+            serialised with an exclusive lock on a separate lock file, and a
+            process that waited for the lock uses the token written by the
+            process that held it instead of refreshing again.
+
+            ARGUMENTS:
+                path:   str: location of the shared authorization file
+                margin: int: seconds before expiry at which to refresh
+        """
+        self.path = path
+        self.margin = margin
+        self.lock_path = f'{path}.lock'
+        self._signature = None
+        self._session = None
+
+    def __repr__(self):
+        return f"<class {type(self).__name__}(path={self.path}, margin={self.margin})>"
+
+    def read(self):
+        """return the stored session, or None if there isn't a usable one"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            try:
+                with open(self.path, 'r') as file:
+                    self._session = json.load(file)
+            except (OSError, ValueError):
+                self._session = None
+            self._signature = signature
+        return self._session
+
+    def valid(self, session):
+        """true if the session holds a token that isn't about to expire"""
+        return bool(session and 'expires_at' in session
+                    and time.time() < session['expires_at'] - self.margin)
+
+    def current(self):
+        """the stored session if its token is still valid, else None"""
+        session = self.read()
+        return session if self.valid(session) else None
+
+    def write(self, session):
+        """atomically replace the stored session"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.auth-')
+        try:
+            with os.fdopen(descriptor, 'w') as file:
+                json.dump(session, file)
+            os.replace(temporary, self.path)
+
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @contextmanager
+    def locked(self):
+        """hold the exclusive cross process refresh lock"""
+        with open(self.lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def refresh(self, request, rejected=None):
+        """return a valid session, refreshing the token at most once.
+
+           ARGUMENTS:
+                request: callable: asks spotify for a new token and returns
+                                   the session dict to store, or None.
+                rejected:     str: authorization header value the api just
+                                   refused. A stored session with this token
+                                   is refreshed even if it looks valid.
+
+           If another process refreshed the token while we waited for the
+           lock, its session is returned without calling request.
+        """
+        with self.locked():
+            session = self.read()
+            if self.valid(session) and session['header']['Authorization'] != rejected:
+                return session
+
+            session = request()
+            if session:
+                self.write(session)
+            return session
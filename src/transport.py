@@ -0,0 +1,131 @@
+"""pooled keep-alive http transport used by the SpotifyClient
+"""
+import weakref
+import threading
+from urllib.parse import urlsplit
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+# connections kept alive per host. the api host sees nearly all of the
+# traffic, the accounts host is only used for token requests.
+POOL_SIZES = {
+    'api.spotify.com': 10,
+    'accounts.spotify.com': 2
+}
+
+
+class ThreadOwner():
+    """kept in a thread's locals, so it is freed when the thread exits"""
+
+
+class ConnectionPool():
+
+    def __init__(self, pool_sizes=None, default_size=4, session_factory=Session):
+        """ Long lived transport that keeps tcp/tls connections open between
+            api calls instead of paying a fresh handshake for every request.
+
+            Every host gets its own HTTPAdapter, sized according to pool_sizes.
+            The adapters are shared by all threads, while each thread gets its
+            own session mounted on those adapters, so the pool can be reused
+            safely from worker threads. A thread's session is closed once
+            the thread exits, so short lived threads don't pile up sessions.
+
+            ARGUMENTS:
+                pool_sizes:      dict: maps a hostname to the number of
+                                       connections kept alive for it. Merged
+                                       with the POOL_SIZES defaults.
+
+                default_size:     int: pool size for hosts not in pool_sizes
+
+                session_factory: callable: returns a new requests session
+
+            USAGE:
+                with ConnectionPool({'api.spotify.com': 20}) as pool:
+                    response = pool.request('get', endpoint, headers=header)
+        """
+        self.sizes = {**POOL_SIZES, **(pool_sizes or {})}
+        self.default_size = default_size
+        self.session_factory = session_factory
+        self.adapters = {}
+        self.sessions = []
+        self.closed = False
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        hosts = ', '.join(f'{host}={size}' for host, size in self.sizes.items())
+        return f"<class {type(self).__name__}({hosts})>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def adapter(self, host):
+        """return the shared adapter for host, creating it on first use"""
+        with self._lock:
+            if host not in self.adapters:
+                size = self.sizes.get(host.split(':')[0], self.default_size)
+                self.adapters[host] = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            return self.adapters[host]
+
+    def session(self, host, scheme='https'):
+        """return the calling thread's session with host's adapter mounted"""
+        if self.closed:
+            raise RuntimeError(f'{type(self).__name__} has been closed')
+
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self.session_factory()
+            self._local.owner = ThreadOwner()
+            weakref.finalize(self._local.owner, self.release, session)
+            with self._lock:
+                self.sessions.append(session)
+
+        prefix = f'{scheme}://{host}'
+        if prefix not in session.adapters:
+            session.mount(prefix, self.adapter(host))
+        return session
+
+    def release(self, session):
+        """close the session of a thread that has exited"""
+        with self._lock:
+            if session not in self.sessions:
+                return
+            self.sessions.remove(session)
+            shared = list(self.adapters.values())
+        # the host adapters and their connections belong to every thread
+        for prefix, adapter in list(session.adapters.items()):
+            if any(adapter is other for other in shared):
+                del session.adapters[prefix]
+        session.close()
+
+    def request(self, method, endpoint, **kwargs):
+        """send a request over a pooled keep-alive connection"""
+        parts = urlsplit(endpoint)
+        return self.session(parts.netloc, parts.scheme).request(method.upper(), endpoint, **kwargs)
+
+    def connection_stats(self):
+        """connections opened and requests sent per host since the pool was created"""
+        stats = {}
+        with self._lock:
+            for host, adapter in self.adapters.items():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    entry = stats.setdefault(host, {'connections': 0, 'requests': 0})
+                    entry['connections'] += pool.num_connections
+                    entry['requests'] += pool.num_requests
+        return stats
+
+    def close(self):
+        """close every session and pooled connection"""
+        with self._lock:
+            self.closed = True
+            for session in self.sessions:
+                session.close()
+            for adapter in self.adapters.values():
+                adapter.close()
+            self.sessions.clear()
+            self.adapters.clear()
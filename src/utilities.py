@@ -1,14 +1,12 @@
 """utility functions needed by the SpotifyClient and associated scripts
 """
-from datetime import datetime
-from datetime import timedelta
+import time
+from itertools import islice
 
 
 def get_future(secs):
-    """calculate time from now until specific time in the future"""
-    mins = secs / 60
-    future = datetime.now() + timedelta(minutes=mins)
-    return future.strftime('%H:%M:%S')
+    """unix timestamp of the moment secs seconds from now"""
+    return time.time() + secs
 
 
 def fetch(iterable, token):
@@ -38,3 +36,95 @@ def fetch(iterable, token):
         for item in iterable:
             if isinstance(item, (dict, list)):
                 yield from fetch(item, token)
+
+
+def chunked(iterable, size):
+    """split any iterable into lists of at most size items"""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def unique(iterable):
+    """remove duplicates from an iterable, preserving the original order"""
+    return list(dict.fromkeys(iterable))
+
+
+def compile_path(path):
+    """compile a dotted json path into a function that extracts it directly.
+
+       Unlike fetch, which walks the whole document looking for a key, the
+       compiled function only indexes along the path. Segments are dict keys,
+       list indices, or * to map the rest of the path over every list item.
+       Missing keys, bad indices and nulls along the way give the default.
+
+       ARGUMENTS:
+           path: str: e.g. 'item.album.name', 'item.artists.0.name' or
+                      'items.*.track.uri'
+
+       USAGE:
+           album = compile_path('item.album.name')
+           album(playback_data)
+           uris = compile_path('items.*.track.uri')(playlist_page, default=[])
+    """
+    segments = path.split('.')
+    if '*' in segments:
+        split = segments.index('*')
+        head = compile_path('.'.join(segments[:split])) if split else None
+        tail = compile_path('.'.join(segments[split + 1:])) if split + 1 < len(segments) else None
+        missing = object()
+
+        def extract_all(data, default=None):
+            items = head(data, missing) if head else data
+            if not isinstance(items, list):
+                return default
+            if tail is None:
+                return list(items)
+            values = (tail(item, missing) for item in items)
+            return [value for value in values if value is not missing]
+
+        return extract_all
+
+    keys = [int(segment) if segment.lstrip('-').isdigit() else segment for segment in segments]
+
+    def extract(data, default=None):
+        try:
+            for key in keys:
+                data = data[key]
+            return data
+
+        except (KeyError, IndexError, TypeError):
+            return default
+
+    return extract
+
+
+def fetch_many(iterable, tokens):
+    """single pass version of fetch for several keys at once.
+
+       Walks the json document once and returns a dict mapping each of the
+       tokens to the list of values found for it, in document order.
+
+       ARGUMENTS:
+           iterable: json object; (dict, list)
+           tokens:   iterable of str: the json/dict keys to collect
+    """
+    found = {token: [] for token in tokens}
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in found:
+                    found[key].append(value)
+                if isinstance(value, (dict, list)):
+                    walk(value)
+
+        elif isinstance(node, list):
+            for item in node:
+                if isinstance(item, (dict, list)):
+                    walk(item)
+
+    walk(iterable)
+    return found